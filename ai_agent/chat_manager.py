@@ -1,28 +1,41 @@
 import asyncio
 import logging
 import json
-from typing import Dict, List, Any, Optional
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from fastapi import WebSocket
 from datetime import datetime
 import uuid
 
+from session_store import InMemorySessionStore, SessionStore
+
 logger = logging.getLogger(__name__)
 
 class ChatManager:
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[SessionStore] = None,
+        max_messages: int = 20,
+        cache_size: int = 1024,
+        cache_ttl: float = 30.0
+    ):
         self.active_connections: Dict[str, WebSocket] = {}
-        self.conversation_history: Dict[str, List[Dict[str, Any]]] = {}
-        self.user_sessions: Dict[str, str] = {}  # user_id -> session_id
+        self.store = store or InMemorySessionStore()
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        # Other workers may append to the same session, so cached copies are reloaded after this long
+        self.cache_ttl = cache_ttl
+        # Hot sessions: session_id -> (loaded_at, messages), least recently used first
+        self.conversation_history: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
         
     async def connect(self, websocket: WebSocket, session_id: str):
         """Connect a new WebSocket client"""
         await websocket.accept()
         self.active_connections[session_id] = websocket
         
-        # Initialize conversation history for this session
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
-        
         logger.info(f"Client connected: {session_id}")
         
         # Send welcome message
@@ -39,31 +52,49 @@ class ChatManager:
             del self.active_connections[session_id]
             logger.info(f"Client disconnected: {session_id}")
     
+    async def _history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Messages for a session, from the local cache or loaded from the store"""
+        cached = self.conversation_history.get(session_id)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            self.conversation_history.move_to_end(session_id)
+            self.cache_hits += 1
+            return cached[1]
+        
+        self.cache_misses += 1
+        messages = await self.store.load_history(session_id) or []
+        self._cache(session_id, messages)
+        return messages
+    
+    def _cache(self, session_id: str, messages: List[Dict[str, Any]]):
+        self.conversation_history[session_id] = (time.monotonic(), messages)
+        self.conversation_history.move_to_end(session_id)
+        while len(self.conversation_history) > self.cache_size:
+            self.conversation_history.popitem(last=False)
+    
     async def add_message(self, session_id: str, role: str, content: str):
         """Add a message to conversation history"""
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
-        
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        self.conversation_history[session_id].append(message)
-        
-        # Keep only last 20 messages to prevent memory issues
-        if len(self.conversation_history[session_id]) > 20:
-            self.conversation_history[session_id] = self.conversation_history[session_id][-20:]
+        await self.add_messages(session_id, [(role, content)])
+    
+    async def add_messages(self, session_id: str, messages: List[Tuple[str, str]]):
+        """Add several (role, content) messages with a single write to the store"""
+        timestamp = datetime.now().isoformat()
+        new_messages = [
+            {"role": role, "content": content, "timestamp": timestamp}
+            for role, content in messages
+        ]
+        
+        # Write through; a session that is not cached is left to load lazily on its next read
+        await self.store.append_messages(session_id, new_messages, self.max_messages)
+        cached = self.conversation_history.get(session_id)
+        if cached is not None:
+            # Keep only the last max_messages messages to prevent memory issues
+            self._cache(session_id, (cached[1] + new_messages)[-self.max_messages:])
     
     async def get_conversation_history(self, session_id: str) -> List[Dict[str, str]]:
         """Get conversation history for a session"""
-        if session_id not in self.conversation_history:
-            return []
-        
         # Return only user and assistant messages (exclude system messages)
         messages = []
-        for msg in self.conversation_history[session_id]:
+        for msg in await self._history(session_id):
             if msg["role"] in ["user", "assistant"]:
                 messages.append({
                     "role": msg["role"],
@@ -114,16 +145,16 @@ class ChatManager:
         session_id = str(uuid.uuid4())
         
         if user_id:
-            self.user_sessions[user_id] = session_id
+            await self.store.set_user_session(user_id, session_id)
         
-        self.conversation_history[session_id] = []
+        self._cache(session_id, [])
         
         logger.info(f"Created new session: {session_id} for user: {user_id}")
         return session_id
     
     async def get_session_by_user(self, user_id: str) -> Optional[str]:
         """Get session ID for a user"""
-        return self.user_sessions.get(user_id)
+        return await self.store.get_user_session(user_id)
     
     async def end_session(self, session_id: str):
         """End a chat session"""
@@ -131,53 +162,46 @@ class ChatManager:
             await self.active_connections[session_id].close()
             self.disconnect(session_id)
         
-        if session_id in self.conversation_history:
-            del self.conversation_history[session_id]
-        
-        # Remove from user sessions
-        user_id_to_remove = None
-        for user_id, sid in self.user_sessions.items():
-            if sid == session_id:
-                user_id_to_remove = user_id
-                break
-        
-        if user_id_to_remove:
-            del self.user_sessions[user_id_to_remove]
+        self.conversation_history.pop(session_id, None)
+        # Also unlinks any user pointing at this session
+        await self.store.delete_session(session_id)
         
         logger.info(f"Ended session: {session_id}")
     
     async def get_session_stats(self) -> Dict[str, Any]:
         """Get statistics about active sessions"""
+        counts = await self.store.counts()
         return {
             "active_sessions": self.get_session_count(),
-            "total_conversations": len(self.conversation_history),
-            "connected_users": len(self.user_sessions)
+            "total_conversations": counts["sessions"],
+            "connected_users": counts["users"],
+            "cached_sessions": len(self.conversation_history),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
         }
     
     async def clear_old_sessions(self, max_age_hours: int = 24):
         """Clear old conversation history"""
-        cutoff_time = datetime.now().timestamp() - (max_age_hours * 3600)
-        sessions_to_remove = []
-        
-        for session_id, messages in self.conversation_history.items():
-            if messages:
-                # Check if last message is older than cutoff
-                last_message_time = datetime.fromisoformat(messages[-1]["timestamp"]).timestamp()
-                if last_message_time < cutoff_time:
-                    sessions_to_remove.append(session_id)
+        cutoff_time = time.time() - (max_age_hours * 3600)
         
-        for session_id in sessions_to_remove:
-            if session_id not in self.active_connections:  # Only remove inactive sessions
-                del self.conversation_history[session_id]
-                logger.info(f"Cleared old session: {session_id}")
+        # Only remove inactive sessions
+        expired = await self.store.expire_sessions(cutoff_time, keep=self.active_connections.keys())
+        for session_id in expired:
+            self.conversation_history.pop(session_id, None)
+            logger.info(f"Cleared old session: {session_id}")
     
     async def export_conversation(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Export conversation history for a session"""
-        if session_id not in self.conversation_history:
+        messages = await self.store.load_history(session_id)
+        if messages is None:
             return None
         
         return {
             "session_id": session_id,
-            "messages": self.conversation_history[session_id],
+            "messages": messages,
             "exported_at": datetime.now().isoformat()
-        } 
\ No newline at end of file
+        }
+    
+    async def close(self):
+        """Release the session store's connections"""
+        await self.store.close()
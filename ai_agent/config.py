@@ -17,13 +17,62 @@ class Settings(BaseSettings):
     ollama_host: str = "http://localhost:11434"
     ollama_model: str = "llama3.2:1b"
     ollama_timeout: int = 30
+    # Comma-separated Ollama servers to load balance across; falls back to OLLAMA_BASE_URL
+    ollama_base_urls: str = ""
+    ollama_max_attempts: int = 2
+    ollama_connect_timeout: float = 5.0
+    ollama_max_connections: int = 100
+    ollama_max_keepalive_connections: int = 20
+    ollama_keepalive_expiry: float = 30.0
+    ollama_health_interval: float = 15.0
+    ollama_health_ttl: float = 45.0
+    ollama_failure_threshold: int = 3
+    ollama_recovery_timeout: float = 30.0
+    
+    # Generation admission control
+    generation_max_in_flight: int = 4  # per Ollama backend
+    generation_max_queue: int = 64
+    generation_queue_timeout: float = 15.0
+    
+    # Response cache settings
+    response_cache_max_entries: int = 1000
+    response_cache_max_bytes: int = 8 * 1024 * 1024
+    response_cache_ttl: float = 3600.0
+    
+    # Semantic cache settings (embeddings from the local Ollama server)
+    semantic_cache_enabled: bool = True
+    semantic_cache_embedding_model: str = "nomic-embed-text"
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_max_entries: int = 2000
+    semantic_cache_ttl: float = 3600.0
+    
+    # Prompt settings (approximate tokens)
+    prompt_token_budget: int = 1536
+    prompt_context_share: float = 0.6
+    prompt_max_history_messages: int = 10
     
     # Knowledge base settings
     knowledge_base_path: str = "./knowledge_base"
     max_search_results: int = 5
+    passage_size_words: int = 120
+    passage_overlap_words: int = 30
     
     # Database settings
     database_path: str = "./ai_agent.db"
+    db_write_batch_size: int = 200
+    db_write_flush_interval: float = 0.5
+    db_max_pending_writes: int = 10000
+    # Seconds a log call waits for room in a full write queue before dropping the row
+    db_write_backpressure_timeout: float = 1.0
+    data_retention_days: int = 30
+    retention_interval_hours: float = 24.0
+    retention_batch_size: int = 500
+    retention_batch_pause: float = 0.05
+    backup_pages_per_step: int = 256
+    backup_step_pause: float = 0.01
+    # Used when database_url points at PostgreSQL
+    postgres_min_pool_size: int = 1
+    postgres_max_pool_size: int = 10
     
     # Website scraping settings
     website_base_url: str = "http://localhost:5173"
@@ -31,10 +80,22 @@ class Settings(BaseSettings):
     backend_api_url: str = "http://localhost:8080"
     scraping_timeout: int = 10
     max_concurrent_scrapes: int = 5
+    # Build product documents from backend_api_url instead of rendering each product page
+    scrape_products_from_api: bool = True
+    # Pages are re-rendered once their last render is older than this, even if the server reports no change
+    crawl_max_age_hours: float = 24.0
+    # How often the background crawler runs
+    crawl_interval_hours: float = 6.0
     
     # Chat settings
     max_conversation_history: int = 20
     session_timeout_hours: int = 24
+    # memory (single worker only), sqlite (workers on one host) or redis (any number of hosts)
+    session_store: str = "memory"
+    # File path for sqlite, redis:// URL for redis
+    session_store_url: Optional[str] = None
+    session_cache_size: int = 1024
+    session_cache_ttl: float = 30.0
     
     # CORS settings
     allowed_origins: list = [
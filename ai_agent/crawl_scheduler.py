@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from crawl_state import ChangeJournal
+from website_scraper import WebsiteScraper
+
+logger = logging.getLogger(__name__)
+
+IDLE = "idle"
+RUNNING = "running"
+FAILED = "failed"
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+def run_crawl(scraper_options: Dict[str, Any]) -> Dict[str, Any]:
+    """Crawl with a scraper of its own and report how it went, with the crawl's change journal.
+
+    The new snapshot is written to the scraper's data file and the learned
+    route timeouts to its crawl state, so the next crawl starts from them.
+    The crawler builds no index; the serving process applies the journal.
+    """
+    scraper = WebsiteScraper(**scraper_options, build_index=False)
+    scraper.scrape_urls()
+    return {"crawl": scraper.last_crawl, "journal": scraper.last_journal.to_dict()}
+
+
+def _crawl_process(scraper_options: Dict[str, Any], conn):
+    """Crawler process entry point: runs `run_crawl` and sends back (ok, result or error)"""
+    if hasattr(os, "setpgrp"):
+        # Own process group, so stopping the crawl also takes down the Chrome processes it started
+        os.setpgrp()
+    try:
+        conn.send((True, run_crawl(scraper_options)))
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class CrawlScheduler:
+    """Re-crawls the website in a separate process every `interval` seconds.
+
+    Selenium and the rendering work stay out of the server process, so
+    startup and requests never wait on a crawl. Searches keep using the
+    current knowledge base until a crawl finishes. The crawl's change journal
+    is then applied to the served index on the event loop; if it changed more
+    than `max_inline_changes` pages, or doesn't follow on from the served
+    data, the new snapshot is indexed in a worker thread and swapped in instead.
+    """
+
+    def __init__(
+        self,
+        scraper: WebsiteScraper,
+        scraper_options: Dict[str, Any],
+        interval: float = 6 * 3600,
+        max_inline_changes: int = 200
+    ):
+        self.scraper = scraper
+        self.scraper_options = scraper_options
+        self.interval = interval
+        self.max_inline_changes = max_inline_changes
+
+        self.state = IDLE
+        self.runs = 0
+        self.failures = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.next_run_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_crawl: Dict[str, Any] = {}
+        self.last_update: Optional[str] = None  # "journal" or "snapshot"
+        self._process: Optional[multiprocessing.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+
+    def start(self):
+        """Schedule crawls; the first runs right away if there is no data or the last crawl is overdue"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        # Kill a crawl in progress rather than let it hold up shutdown; the data file is
+        # only ever replaced whole, so the next crawl picks up from the last complete one
+        self._terminate()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _terminate(self):
+        process = self._process
+        if process is None or not process.is_alive():
+            return
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGTERM)
+                return
+        except ProcessLookupError:
+            # Stopped before the crawler got its own process group
+            pass
+        process.terminate()
+
+    def _initial_delay(self) -> float:
+        crawled_at = self.scraper.state.crawled_at
+        if not self.scraper.scraped_data or crawled_at is None:
+            return 0.0
+        return max(0.0, crawled_at + self.interval - time.time())
+
+    async def _loop(self):
+        delay = self._initial_delay()
+        while True:
+            self.next_run_at = time.time() + delay
+            await asyncio.sleep(delay)
+            await self.run_once()
+            delay = self.interval
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Crawl now and swap in the result; waits for a crawl already in progress instead of starting another"""
+        if self._run_lock.locked():
+            async with self._run_lock:
+                return self.status()
+        async with self._run_lock:
+            self.state = RUNNING
+            self.next_run_at = None
+            self.started_at = time.time()
+            started = time.monotonic()
+            try:
+                result = await self._crawl()
+                self.last_crawl = result["crawl"]
+                journal = ChangeJournal.from_dict(result["journal"])
+                changed = sum(journal.counts()[kind] for kind in ("added", "updated", "removed"))
+                if changed <= self.max_inline_changes and self.scraper.apply_crawl(journal):
+                    self.last_update = "journal"
+                else:
+                    snapshot = await asyncio.to_thread(self.scraper.load_snapshot)
+                    self.scraper.swap_snapshot(snapshot)
+                    self.last_update = "snapshot"
+                self.state = IDLE
+                self.last_error = None
+                logger.info(f"Crawl finished in {time.monotonic() - started:.1f}s: {self.last_crawl.get('changes')}")
+            except Exception as e:
+                self.state = FAILED
+                self.failures += 1
+                self.last_error = str(e) or type(e).__name__
+                logger.error(f"Crawl failed, still serving the previous knowledge base: {self.last_error}")
+            self.runs += 1
+            self.finished_at = time.time()
+            self.duration = round(time.monotonic() - started, 1)
+        return self.status()
+
+    async def _crawl(self) -> Dict[str, Any]:
+        # Spawn rather than fork: the server process has an event loop and database threads running
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_crawl_process, args=(self.scraper_options, sender), daemon=True)
+        process.start()
+        sender.close()
+        self._process = process
+        try:
+            ok, result = await asyncio.to_thread(self._receive, receiver, process)
+        finally:
+            receiver.close()
+            self._process = None
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    @staticmethod
+    def _receive(receiver, process: multiprocessing.Process):
+        try:
+            message = receiver.recv()
+        except EOFError:
+            process.join()
+            return False, f"crawler process exited with code {process.exitcode}"
+        process.join()
+        return message
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "runs": self.runs,
+            "failures": self.failures,
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+            "duration_seconds": self.duration,
+            "next_run_at": _isoformat(self.next_run_at),
+            "interval_seconds": self.interval,
+            "last_error": self.last_error,
+            "last_crawl": self.last_crawl,
+            "last_update": self.last_update,
+            "documents": len(self.scraper.scraped_data),
+            "passages": len(self.scraper.index),
+        }
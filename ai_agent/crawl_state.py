@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+def content_hash(document: Dict) -> str:
+    """Hash of the parts of a document that end up in the index"""
+    payload = json.dumps(
+        [document.get('title', ''), document.get('content', ''), document.get('metadata', {})],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class ChangeJournal:
+    """What one crawl changed, as deltas a downstream index can apply in order"""
+    sequence: int = 0
+    crawled_at: float = 0.0
+    added: List[Dict] = field(default_factory=list)
+    updated: List[Dict] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)  # URLs
+    unchanged: int = 0
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ChangeJournal':
+        return cls(**data)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            'added': len(self.added),
+            'updated': len(self.updated),
+            'removed': len(self.removed),
+            'unchanged': self.unchanged,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            'sequence': self.sequence,
+            'crawled_at': self.crawled_at,
+            'added': self.added,
+            'updated': self.updated,
+            'removed': self.removed,
+            'unchanged': self.unchanged,
+        }
+
+
+class CrawlState:
+    """Per-URL crawl bookkeeping, persisted as JSON next to the scraped data.
+
+    For each URL it keeps the content hash of the last stored document, when
+    it was last rendered and the HTTP validators (ETag / Last-Modified) seen
+    at that time. `feeds` holds validators for API feeds such as the product
+    catalogue, `sequence` numbers the change journals, `crawled_at` is
+    when the last crawl finished and `route_timeouts` holds recent render
+    times per route type, so readiness timeouts keep adapting across crawls.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: Dict[str, Dict] = {}
+        self.feeds: Dict[str, Dict[str, str]] = {}
+        self.sequence = 0
+        self.crawled_at: Optional[float] = None
+        self.route_timeouts: Dict[str, List[float]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.pages = data.get('pages', {})
+                self.feeds = data.get('feeds', {})
+                self.sequence = data.get('sequence', 0)
+                self.crawled_at = data.get('crawled_at')
+                self.route_timeouts = data.get('route_timeouts', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable crawl state {path}: {e}")
+
+    def save(self):
+        # Write then rename, so a crash mid-write never leaves a truncated file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'sequence': self.sequence,
+                    'crawled_at': self.crawled_at,
+                    'route_timeouts': self.route_timeouts,
+                    'pages': self.pages,
+                    'feeds': self.feeds,
+                },
+                f,
+                indent=2
+            )
+        os.replace(tmp_path, self.path)
+
+    def get(self, url: str) -> Dict:
+        return self.pages.get(url, {})
+
+    def validators(self, url: str) -> Dict[str, str]:
+        page = self.get(url)
+        return {key: page[key] for key in ('etag', 'last_modified') if page.get(key)}
+
+    def is_stale(self, url: str, max_age: float, now: Optional[float] = None) -> bool:
+        """True if the URL was never fetched or was last fetched more than `max_age` seconds ago"""
+        last_fetched = self.get(url).get('last_fetched')
+        return last_fetched is None or (now or time.time()) - last_fetched > max_age
+
+    def record(self, url: str, document: Dict, validators: Optional[Dict[str, str]] = None, fetched_at: Optional[float] = None):
+        self.pages[url] = {
+            'content_hash': content_hash(document),
+            'last_fetched': fetched_at or time.time(),
+            **(validators or {}),
+        }
+
+    def forget(self, url: str):
+        self.pages.pop(url, None)
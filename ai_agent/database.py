@@ -1,66 +1,186 @@
 import asyncio
 import logging
 import json
-import sqlite3
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-import aiosqlite
-import os
+
+from storage import RETENTION_TABLES, StorageBackend
+from sqlite_storage import SQLiteStorage
 
 logger = logging.getLogger(__name__)
 
+
+def create_storage(
+    database_url: Optional[str],
+    db_path: str = "./ai_agent.db",
+    backup_pages_per_step: int = 256,
+    backup_step_pause: float = 0.01,
+    min_pool_size: int = 1,
+    max_pool_size: int = 10
+) -> StorageBackend:
+    """Pick the storage backend for a database URL, defaulting to the SQLite file at db_path"""
+    if database_url and database_url.startswith(("postgres://", "postgresql://")):
+        # Imported here so asyncpg is only needed by deployments that use PostgreSQL
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(database_url, min_pool_size=min_pool_size, max_pool_size=max_pool_size)
+    if database_url:
+        if not database_url.startswith("sqlite:///"):
+            raise ValueError(f"Unsupported database URL: {database_url}")
+        db_path = database_url[len("sqlite:///"):]
+    return SQLiteStorage(db_path, backup_pages_per_step=backup_pages_per_step, backup_step_pause=backup_step_pause)
+
 class DatabaseManager:
-    def __init__(self, db_path: str = "./ai_agent.db"):
+    def __init__(
+        self,
+        db_path: str = "./ai_agent.db",
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        max_pending_writes: int = 10000,
+        backpressure_timeout: float = 1.0,
+        retention_batch_size: int = 500,
+        retention_batch_pause: float = 0.05,
+        backup_pages_per_step: int = 256,
+        backup_step_pause: float = 0.01,
+        database_url: Optional[str] = None,
+        min_pool_size: int = 1,
+        max_pool_size: int = 10,
+        storage: Optional[StorageBackend] = None
+    ):
         self.db_path = db_path
-        
-    async def initialize(self):
-        """Initialize the database and create tables"""
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending_writes = max_pending_writes
+        # How long a log call waits for room in a full write queue before the row is dropped
+        self.backpressure_timeout = backpressure_timeout
+        self.retention_batch_size = retention_batch_size
+        self.retention_batch_pause = retention_batch_pause
+        self.storage = storage or create_storage(
+            database_url,
+            db_path,
+            backup_pages_per_step=backup_pages_per_step,
+            backup_step_pause=backup_step_pause,
+            min_pool_size=min_pool_size,
+            max_pool_size=max_pool_size
+        )
+        self._retention_task: Optional[asyncio.Task] = None
+        # Write-behind queue of (table, row) pairs, drained in batches by _write_loop
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self.batches_written = 0
+        self.rows_written = 0
+        self.write_errors = 0
+        self.dropped_writes = 0
+    
+    async def initialize(self, start_writer: bool = True):
+        """Initialize the database, bringing its schema up to the latest version.
+
+        Without the background writer (start_writer=False) every log call
+        writes directly, which suits one-off scripts that don't run the app.
+        Either way, call close() when done to release the connection.
+        """
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # Create conversations table
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS conversations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        session_id TEXT NOT NULL,
-                        user_id TEXT,
-                        user_message TEXT NOT NULL,
-                        ai_response TEXT NOT NULL,
-                        sources TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create analytics table
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS analytics (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        event_type TEXT NOT NULL,
-                        session_id TEXT,
-                        user_id TEXT,
-                        data TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create knowledge_base_logs table
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS knowledge_base_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        action TEXT NOT NULL,
-                        document_url TEXT,
-                        document_title TEXT,
-                        status TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                await db.commit()
-                logger.info("Database initialized successfully")
-                
+            await self.storage.initialize()
+            if start_writer:
+                self._start_writer()
+            logger.info(f"Database initialized successfully ({type(self.storage).__name__})")
+            
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
     
+    async def schema_version(self) -> int:
+        """Latest migration applied to the database, 0 if none"""
+        return await self.storage.schema_version()
+    
+    def _start_writer(self):
+        """Start the background task that flushes queued writes"""
+        if self._writer_task is None:
+            self._write_queue = asyncio.Queue(maxsize=self.max_pending_writes)
+            self._writer_task = asyncio.create_task(self._write_loop())
+    
+    async def _enqueue_write(self, table: str, row: Tuple[Any, ...]) -> bool:
+        """Queue a row for the batched writer, or write it directly if the writer is not running.
+
+        When max_pending_writes rows are already waiting, waits up to
+        backpressure_timeout for room, which slows callers only while the
+        database is falling behind. After that the row is dropped and counted,
+        so memory stays bounded. Returns False if the row was dropped.
+        """
+        if self._writer_task is None:
+            await self._write_batch([(table, row)])
+            return True
+        try:
+            self._write_queue.put_nowait((table, row))
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._write_queue.put((table, row)), self.backpressure_timeout)
+            except asyncio.TimeoutError:
+                self.dropped_writes += 1
+                logger.warning(f"Write queue full, dropped a row for {table}")
+                return False
+        return True
+    
+    async def _write_loop(self):
+        """Collect queued rows and write them in batches by size or time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._write_queue.get()
+            if item is None:
+                self._write_queue.task_done()
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._write_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._write_queue.task_done()
+            if stop:
+                return
+    
+    async def _write_batch(self, batch: List[Tuple[str, Tuple[Any, ...]]]):
+        """Write a batch of rows and their rollups in a single transaction"""
+        rows_by_table: Dict[str, List[Tuple[Any, ...]]] = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+            
+        try:
+            await self.storage.write_batch(rows_by_table, datetime.utcnow())
+            self.batches_written += 1
+            self.rows_written += len(batch)
+        except Exception as e:
+            self.write_errors += 1
+            logger.error(f"Error writing batch of {len(batch)} rows: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Write queue depth and throughput counters"""
+        return {
+            "pending": self._write_queue.qsize() if self._write_queue is not None else 0,
+            "max_pending": self.max_pending_writes,
+            "batches_written": self.batches_written,
+            "rows_written": self.rows_written,
+            "write_errors": self.write_errors,
+            "dropped": self.dropped_writes,
+        }
+    
+    async def flush(self):
+        """Wait until every queued write has been committed"""
+        if self._writer_task is not None:
+            await self._write_queue.join()
+    
     async def log_conversation(
         self, 
         session_id: str, 
@@ -71,51 +191,34 @@ class DatabaseManager:
     ):
         """Log a conversation exchange"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO conversations (session_id, user_id, user_message, ai_response, sources)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    session_id,
-                    user_id,
-                    user_message,
-                    ai_response,
-                    json.dumps(sources) if sources else None
-                ))
-                await db.commit()
-                
+            await self._enqueue_write("conversations", (
+                session_id,
+                user_id,
+                user_message,
+                ai_response,
+                json.dumps(sources) if sources else None
+            ))
+            
         except Exception as e:
             logger.error(f"Error logging conversation: {e}")
     
+    async def log_exchange(
+        self,
+        session_id: str,
+        user_id: Optional[str],
+        user_message: str,
+        ai_response: str,
+        sources: Optional[List[Dict[str, Any]]] = None,
+        channel: str = "rest"
+    ):
+        """Log a chat exchange and its chat_message analytics event"""
+        await self.log_conversation(session_id, user_id, user_message, ai_response, sources)
+        await self.log_analytics_event("chat_message", session_id=session_id, user_id=user_id, data={"channel": channel})
+    
     async def get_conversation_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get conversation history for a session"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                
-                cursor = await db.execute("""
-                    SELECT * FROM conversations 
-                    WHERE session_id = ? 
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                """, (session_id, limit))
-                
-                rows = await cursor.fetchall()
-                conversations = []
-                
-                for row in rows:
-                    conversations.append({
-                        "id": row["id"],
-                        "session_id": row["session_id"],
-                        "user_id": row["user_id"],
-                        "user_message": row["user_message"],
-                        "ai_response": row["ai_response"],
-                        "sources": json.loads(row["sources"]) if row["sources"] else [],
-                        "created_at": row["created_at"]
-                    })
-                
-                return conversations
-                
+            return await self.storage.get_conversation_history(session_id, limit)
         except Exception as e:
             logger.error(f"Error getting conversation history: {e}")
             return []
@@ -129,57 +232,20 @@ class DatabaseManager:
     ):
         """Log an analytics event"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO analytics (event_type, session_id, user_id, data)
-                    VALUES (?, ?, ?, ?)
-                """, (
-                    event_type,
-                    session_id,
-                    user_id,
-                    json.dumps(data) if data else None
-                ))
-                await db.commit()
-                
+            await self._enqueue_write("analytics", (
+                event_type,
+                session_id,
+                user_id,
+                json.dumps(data) if data else None
+            ))
+            
         except Exception as e:
             logger.error(f"Error logging analytics event: {e}")
     
     async def get_analytics_summary(self, days: int = 7) -> Dict[str, Any]:
-        """Get analytics summary for the specified number of days"""
+        """Get analytics summary for the specified number of days, read from the rollups"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                
-                # Get total conversations
-                cursor = await db.execute("""
-                    SELECT COUNT(*) as count FROM conversations 
-                    WHERE created_at >= datetime('now', '-{} days')
-                """.format(days))
-                total_conversations = (await cursor.fetchone())["count"]
-                
-                # Get unique users
-                cursor = await db.execute("""
-                    SELECT COUNT(DISTINCT user_id) as count FROM conversations 
-                    WHERE user_id IS NOT NULL AND created_at >= datetime('now', '-{} days')
-                """.format(days))
-                unique_users = (await cursor.fetchone())["count"]
-                
-                # Get event counts
-                cursor = await db.execute("""
-                    SELECT event_type, COUNT(*) as count FROM analytics 
-                    WHERE created_at >= datetime('now', '-{} days')
-                    GROUP BY event_type
-                """.format(days))
-                events = await cursor.fetchall()
-                event_counts = {row["event_type"]: row["count"] for row in events}
-                
-                return {
-                    "period_days": days,
-                    "total_conversations": total_conversations,
-                    "unique_users": unique_users,
-                    "event_counts": event_counts
-                }
-                
+            return await self.storage.get_analytics_summary(days)
         except Exception as e:
             logger.error(f"Error getting analytics summary: {e}")
             return {}
@@ -193,107 +259,83 @@ class DatabaseManager:
     ):
         """Log knowledge base actions"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO knowledge_base_logs (action, document_url, document_title, status)
-                    VALUES (?, ?, ?, ?)
-                """, (action, document_url, document_title, status))
-                await db.commit()
-                
+            await self._enqueue_write("knowledge_base_logs", (action, document_url, document_title, status))
+            
         except Exception as e:
             logger.error(f"Error logging knowledge base action: {e}")
     
     async def get_popular_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get most popular user queries"""
+        """Get most popular user queries (normalized, approximate counts) from the all-time sketch"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                
-                cursor = await db.execute("""
-                    SELECT user_message, COUNT(*) as count 
-                    FROM conversations 
-                    GROUP BY user_message 
-                    ORDER BY count DESC 
-                    LIMIT ?
-                """, (limit,))
-                
-                rows = await cursor.fetchall()
-                return [{"query": row["user_message"], "count": row["count"]} for row in rows]
-                
+            return await self.storage.get_popular_queries(limit)
         except Exception as e:
             logger.error(f"Error getting popular queries: {e}")
             return []
     
     async def search_conversations(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
-        """Search conversations by content"""
+        """Search conversations by content, best matches first with highlighted snippets"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
-                
-                cursor = await db.execute("""
-                    SELECT * FROM conversations 
-                    WHERE user_message LIKE ? OR ai_response LIKE ?
-                    ORDER BY created_at DESC 
-                    LIMIT ?
-                """, (f"%{query}%", f"%{query}%", limit))
-                
-                rows = await cursor.fetchall()
-                conversations = []
-                
-                for row in rows:
-                    conversations.append({
-                        "id": row["id"],
-                        "session_id": row["session_id"],
-                        "user_id": row["user_id"],
-                        "user_message": row["user_message"],
-                        "ai_response": row["ai_response"],
-                        "created_at": row["created_at"]
-                    })
-                
-                return conversations
-                
+            return await self.storage.search_conversations(query, limit)
         except Exception as e:
             logger.error(f"Error searching conversations: {e}")
             return []
     
     async def close(self):
-        """Close database connections"""
-        # aiosqlite handles connection closing automatically
-        pass
+        """Drain queued writes and close the database connection"""
+        await self.stop_retention()
+        if self._writer_task is not None:
+            # The sentinel queues behind pending rows, so everything before it is written
+            await self._write_queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        await self.storage.close()
     
     async def backup_database(self, backup_path: str):
-        """Create a backup of the database"""
+        """Create a consistent backup of the database without stalling writers"""
         try:
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            await self.storage.backup(backup_path)
             logger.info(f"Database backed up to: {backup_path}")
         except Exception as e:
             logger.error(f"Error backing up database: {e}")
     
-    async def cleanup_old_data(self, days: int = 30):
-        """Clean up old data from the database"""
+    async def cleanup_old_data(self, days: int = 30) -> Dict[str, int]:
+        """Delete rows older than `days` in small batches, yielding to writers between batches.
+
+        Rollup tables are kept, so summaries still cover the deleted period.
+        """
+        deleted = {}
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                # Clean up old conversations
-                await db.execute("""
-                    DELETE FROM conversations 
-                    WHERE created_at < datetime('now', '-{} days')
-                """.format(days))
-                
-                # Clean up old analytics
-                await db.execute("""
-                    DELETE FROM analytics 
-                    WHERE created_at < datetime('now', '-{} days')
-                """.format(days))
-                
-                # Clean up old knowledge base logs
-                await db.execute("""
-                    DELETE FROM knowledge_base_logs 
-                    WHERE created_at < datetime('now', '-{} days')
-                """.format(days))
-                
-                await db.commit()
-                logger.info(f"Cleaned up data older than {days} days")
-                
+            for table in RETENTION_TABLES:
+                deleted[table] = 0
+                while True:
+                    count = await self.storage.delete_expired(table, days, self.retention_batch_size)
+                    deleted[table] += count
+                    if count < self.retention_batch_size:
+                        break
+                    await asyncio.sleep(self.retention_batch_pause)
+                    
+            logger.info(f"Cleaned up data older than {days} days: {deleted}")
+            
         except Exception as e:
-            logger.error(f"Error cleaning up old data: {e}") 
\ No newline at end of file
+            logger.error(f"Error cleaning up old data: {e}")
+        return deleted
+    
+    def start_retention(self, days: int, interval: float):
+        """Run cleanup_old_data every `interval` seconds in the background"""
+        if self._retention_task is None:
+            self._retention_task = asyncio.create_task(self._retention_loop(days, interval))
+    
+    async def stop_retention(self):
+        """Stop the background retention task"""
+        if self._retention_task is not None:
+            self._retention_task.cancel()
+            try:
+                await self._retention_task
+            except asyncio.CancelledError:
+                pass
+            self._retention_task = None
+    
+    async def _retention_loop(self, days: int, interval: float):
+        while True:
+            await self.cleanup_old_data(days)
+            await asyncio.sleep(interval)
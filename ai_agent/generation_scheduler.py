@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+# Lower values are admitted first
+PRIORITY_USER_WEBSOCKET = 0
+PRIORITY_USER_REST = 1
+PRIORITY_ANONYMOUS_WEBSOCKET = 2
+PRIORITY_ANONYMOUS_REST = 3
+
+
+def request_priority(user_id: Optional[str], websocket: bool) -> int:
+    """Logged-in users go before anonymous ones, WebSocket before REST"""
+    anonymous = not user_id or user_id == "anonymous"
+    if anonymous:
+        return PRIORITY_ANONYMOUS_WEBSOCKET if websocket else PRIORITY_ANONYMOUS_REST
+    return PRIORITY_USER_WEBSOCKET if websocket else PRIORITY_USER_REST
+
+
+class AdmissionError(Exception):
+    """A generation was not admitted to the backend"""
+
+
+class QueueFullError(AdmissionError):
+    """The wait queue is at capacity"""
+
+
+class QueueTimeoutError(AdmissionError):
+    """A queued generation hit its deadline before a slot freed up"""
+
+
+class GenerationScheduler:
+    """Admission control for model generations.
+
+    At most `max_in_flight` generations run at once. Further requests wait in
+    a bounded priority queue (FIFO within a priority) and give up with
+    QueueTimeoutError once their deadline passes, so callers can fall back to
+    a cheap answer instead of piling more work on the backend. When the queue
+    is full, a request that outranks the worst waiter takes its place and the
+    waiter gets QueueFullError; otherwise the newcomer is refused.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 64, queue_timeout: float = 15.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=500)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_ANONYMOUS_REST, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold a generation slot for the duration of the block"""
+        await self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = PRIORITY_ANONYMOUS_REST, timeout: Optional[float] = None):
+        """Wait for a generation slot, raising AdmissionError if none is granted in time"""
+        started = time.monotonic()
+        if self.in_flight < self.max_in_flight and not self._queued:
+            self.in_flight += 1
+            self._record_admission(started)
+            return
+
+        if self._queued >= self.max_queue and not self._evict_below(priority):
+            self.rejected += 1
+            raise QueueFullError(f"Generation queue is full ({self.max_queue} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.queue_timeout if timeout is None else timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()  # slot was handed over just as the caller went away
+            elif not waiter.done():
+                waiter.cancel()
+                self._queued -= 1
+            raise
+
+        if not done:
+            waiter.cancel()
+            self._queued -= 1
+            self.timeouts += 1
+            raise QueueTimeoutError(f"No generation slot within {time.monotonic() - started:.1f}s")
+
+        waiter.result()  # raises QueueFullError if a higher priority request evicted us
+        self._record_admission(started)
+
+    def release(self):
+        """Free a slot, handing it straight to the best waiting request if there is one"""
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue  # timed out, cancelled or evicted
+            self._queued -= 1
+            waiter.set_result(None)  # the slot moves to the waiter, in_flight is unchanged
+            return
+        self.in_flight -= 1
+
+    def _evict_below(self, priority: int) -> bool:
+        """Drop the most recent waiter of the worst priority if it ranks below `priority`"""
+        worst = max((entry for entry in self._waiters if not entry[2].done()), default=None)
+        if worst is None or worst[0] <= priority:
+            return False
+        worst[2].set_exception(QueueFullError("Evicted from a full generation queue by a higher priority request"))
+        self._queued -= 1
+        self.evicted += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Concurrency, queue depth and wait time metrics"""
+        recent = sorted(self._recent_waits)
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._queued,
+            "max_queue": self.max_queue,
+            "max_queue_depth_seen": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self._total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "p95_wait_ms": round(recent[int(len(recent) * 0.95) - 1] * 1000, 1) if recent else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+        }
+
+    def _record_admission(self, started: float):
+        wait = time.monotonic() - started
+        self.admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        self._recent_waits.append(wait)
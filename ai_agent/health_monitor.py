@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"        # healthy, traffic flows
+OPEN = "open"            # tripped, callers should fall back to demo mode
+HALF_OPEN = "half_open"  # cooling off elapsed, next probe decides
+
+
+class HealthMonitor:
+    """Background health prober with a cached result and a circuit breaker.
+
+    A probe coroutine is run every `interval` seconds. Readers on the hot path
+    only look at the cached state. After `failure_threshold` consecutive
+    failures (probes or reported request errors) the circuit opens; once
+    `recovery_timeout` has passed it goes half-open and a single successful
+    probe closes it again.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], Awaitable[bool]],
+        name: str = "ollama",
+        interval: float = 15.0,
+        ttl: float = 45.0,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0
+    ):
+        self.probe = probe
+        self.name = name
+        self.interval = interval
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.state = CLOSED
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.last_checked: Optional[float] = None
+        self.last_success: Optional[float] = None
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._probe_lock = asyncio.Lock()
+
+    @property
+    def is_available(self) -> bool:
+        """Cheap hot-path check: recent successful probe and circuit not open"""
+        if self.state == OPEN:
+            if self.opened_at is not None and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+            return False
+        if self.state == HALF_OPEN:
+            return False
+        # Isolated failures below the threshold don't flip us to demo mode, a stale success does
+        return self.last_success is not None and time.monotonic() - self.last_success <= self.ttl
+
+    async def start(self):
+        """Run an initial probe and start the background loop"""
+        if self._task is not None:
+            return
+        await self.check_now()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background loop"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def check_now(self) -> bool:
+        """Probe immediately and update the cached state"""
+        async with self._probe_lock:
+            try:
+                ok = await self.probe()
+                error = None if ok else "probe reported unhealthy"
+            except Exception as e:
+                ok = False
+                error = str(e)
+            self.last_checked = time.monotonic()
+            if ok:
+                self.record_success()
+            else:
+                self.record_failure(error)
+            return ok
+
+    def record_success(self):
+        """Mark the backend healthy and close the circuit"""
+        if self.state != CLOSED:
+            logger.info(f"{self.name} circuit closed, leaving demo mode")
+        self.healthy = True
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_success = time.monotonic()
+
+    def record_failure(self, error: Optional[str] = None):
+        """Count a failure and trip the circuit after too many in a row"""
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            logger.warning(f"{self.name} circuit opened after {self.consecutive_failures} failures, running in demo mode")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current health state for the health endpoint"""
+        now = time.monotonic()
+        return {
+            "available": self.is_available,
+            "circuit": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_checked_seconds_ago": round(now - self.last_checked, 1) if self.last_checked is not None else None,
+            "last_success_seconds_ago": round(now - self.last_success, 1) if self.last_success is not None else None,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.state == OPEN:
+                if self.opened_at is not None and time.monotonic() - self.opened_at < self.recovery_timeout:
+                    continue
+                self.state = HALF_OPEN
+            await self.check_now()
@@ -1,18 +1,22 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional, Union
 import json
 import asyncio
 import logging
+import time
 from datetime import datetime
 import uuid
 
 from chat_manager import ChatManager
+from session_store import create_session_store
 from ollama_client import OllamaClient
 from website_scraper import WebsiteScraper
+from crawl_scheduler import CrawlScheduler
 from database import DatabaseManager
+from generation_scheduler import request_priority
 from config import settings
 
 # Configure logging
@@ -35,10 +39,40 @@ app.add_middleware(
 )
 
 # Initialize components
-chat_manager = ChatManager()
+chat_manager = ChatManager(
+    store=create_session_store(settings.session_store, settings.session_store_url),
+    max_messages=settings.max_conversation_history,
+    cache_size=settings.session_cache_size,
+    cache_ttl=settings.session_cache_ttl
+)
 ollama_client = OllamaClient()
-website_scraper = WebsiteScraper(base_url="http://localhost:5173")
-db_manager = DatabaseManager()
+# The crawler process builds its own scraper from the same options
+scraper_options = dict(
+    base_url="http://localhost:5173",
+    passage_size=settings.passage_size_words,
+    passage_overlap=settings.passage_overlap_words,
+    max_workers=settings.max_concurrent_scrapes,
+    page_timeout=settings.scraping_timeout,
+    api_base_url=settings.backend_api_url,
+    products_from_api=settings.scrape_products_from_api,
+    max_age=settings.crawl_max_age_hours * 3600
+)
+website_scraper = WebsiteScraper(**scraper_options)
+crawl_scheduler = CrawlScheduler(website_scraper, scraper_options, interval=settings.crawl_interval_hours * 3600)
+db_manager = DatabaseManager(
+    db_path=settings.database_path,
+    batch_size=settings.db_write_batch_size,
+    flush_interval=settings.db_write_flush_interval,
+    max_pending_writes=settings.db_max_pending_writes,
+    backpressure_timeout=settings.db_write_backpressure_timeout,
+    retention_batch_size=settings.retention_batch_size,
+    retention_batch_pause=settings.retention_batch_pause,
+    backup_pages_per_step=settings.backup_pages_per_step,
+    backup_step_pause=settings.backup_step_pause,
+    database_url=settings.database_url,
+    min_pool_size=settings.postgres_min_pool_size,
+    max_pool_size=settings.postgres_max_pool_size
+)
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -62,16 +96,20 @@ async def startup_event():
     """Initialize the AI agent on startup"""
     logger.info("Starting BigBikeBlitz AI Agent...")
     await db_manager.initialize()
-    # Scrape website data if not already available
-    if not website_scraper.scraped_data:
-        website_scraper.scrape_urls()
+    db_manager.start_retention(settings.data_retention_days, settings.retention_interval_hours * 3600)
+    await ollama_client.start()
+    # Crawls run in the background; until the first one finishes, searches use whatever data is on disk
+    crawl_scheduler.start()
     logger.info("AI Agent started successfully!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down AI Agent...")
+    await crawl_scheduler.stop()
+    await ollama_client.close()
     await db_manager.close()
+    await chat_manager.close()
 
 @app.websocket("/ws/chat/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
@@ -89,10 +127,19 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             user_id = message_data.get("user_id")
             
             if user_message.strip():
-                # Generate AI response
-                response = await generate_ai_response(user_message, session_id, user_id)
+                # Stream AI response tokens as they are generated
+                response = None
+                async for event in stream_ai_response(user_message, session_id, user_id, websocket=True):
+                    if isinstance(event, ChatResponse):
+                        response = event
+                        continue
+                    await websocket.send_text(json.dumps({
+                        "type": "token",
+                        "content": event,
+                        "session_id": session_id
+                    }))
                 
-                # Send response back to client
+                # Send the complete response back to client
                 await websocket.send_text(json.dumps({
                     "type": "response",
                     "message": response.response,
@@ -101,13 +148,14 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     "sources": response.sources
                 }))
                 
-                # Log conversation
-                await db_manager.log_conversation(
+                # Persisted in the background so the next message is not held up by the database
+                await db_manager.log_exchange(
                     session_id=session_id,
                     user_id=user_id,
                     user_message=user_message,
                     ai_response=response.response,
-                    sources=response.sources
+                    sources=response.sources,
+                    channel="websocket"
                 )
     
     except WebSocketDisconnect:
@@ -123,60 +171,200 @@ async def chat_endpoint(chat_message: ChatMessage):
             chat_message.session_id or str(uuid.uuid4()),
             chat_message.user_id
         )
+        await db_manager.log_exchange(
+            session_id=response.session_id,
+            user_id=chat_message.user_id,
+            user_message=chat_message.message,
+            ai_response=response.response,
+            sources=response.sources,
+            channel="rest"
+        )
         return response
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(chat_message: ChatMessage):
+    """Server-Sent Events variant of the chat endpoint"""
+    session_id = chat_message.session_id or str(uuid.uuid4())
+    
+    async def event_stream():
+        started = time.perf_counter()
+        first_token_at = None
+        async for event in stream_ai_response(chat_message.message, session_id, chat_message.user_id):
+            if isinstance(event, ChatResponse):
+                await db_manager.log_exchange(
+                    session_id=session_id,
+                    user_id=chat_message.user_id,
+                    user_message=chat_message.message,
+                    ai_response=event.response,
+                    sources=event.sources,
+                    channel="sse"
+                )
+                finished = time.perf_counter()
+                yield format_sse("done", {
+                    "response": event.response,
+                    "session_id": event.session_id,
+                    "timestamp": event.timestamp.isoformat(),
+                    "sources": event.sources,
+                    "timing": {
+                        "time_to_first_token_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+                        "total_ms": round((finished - started) * 1000, 1)
+                    }
+                })
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield format_sse("token", {"content": event})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop nginx-style proxies from buffering the stream
+        }
+    )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "ollama_status": await ollama_client.check_health(),
+        "ollama_status": ollama_client.pool.is_available,
+        "ollama": ollama_client.pool.snapshot(),
+        "database_writes": db_manager.stats(),
     }
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Response cache hit/miss/eviction counters"""
+    return {
+        "exact": ollama_client.response_cache.stats(),
+        "semantic": ollama_client.semantic_cache.stats() if ollama_client.semantic_cache is not None else None,
+        "single_flight": ollama_client.single_flight.stats(),
+    }
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """Generation concurrency, queue depth and wait time metrics"""
+    return ollama_client.scheduler.stats()
+
+@app.get("/api/analytics/summary")
+async def analytics_summary(days: int = 7, limit: int = 10):
+    """Conversation and event counts plus top queries, served from the rollup tables"""
+    return {
+        "summary": await db_manager.get_analytics_summary(days),
+        "popular_queries": await db_manager.get_popular_queries(limit),
+    }
+
+@app.get("/api/crawl/status")
+async def crawl_status():
+    """Background crawl state, duration of the last crawl and what it changed"""
+    return crawl_scheduler.status()
+
 @app.get("/health")
 async def root_health():
     return {"status": "ok"}
 
-async def generate_ai_response(message: str, session_id: str, user_id: Optional[str] = None) -> ChatResponse:
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again later."
+
+async def generate_ai_response(
+    message: str,
+    session_id: str,
+    user_id: Optional[str] = None,
+    websocket: bool = False
+) -> ChatResponse:
     """Generate AI response using Mistral 7B"""
     try:
-        # Get conversation history
-        history = await chat_manager.get_conversation_history(session_id)
-        # Search website data for relevant information
-        relevant_docs = website_scraper.search(message, max_results=5)
-        # Create context from relevant documents
-        context = create_context_from_documents(relevant_docs)
+        history, relevant_docs, context = await prepare_ai_request(message, session_id)
         # Generate response using Ollama
         ai_response = await ollama_client.generate_response(
             message=message,
             context=context,
-            history=history
+            history=history,
+            priority=request_priority(user_id, websocket)
         )
         # Update conversation history
-        await chat_manager.add_message(session_id, "user", message)
-        await chat_manager.add_message(session_id, "assistant", ai_response)
+        await chat_manager.add_messages(session_id, [("user", message), ("assistant", ai_response)])
         return ChatResponse(
             response=ai_response,
             session_id=session_id,
             timestamp=datetime.now(),
-            sources=[{"title": doc.get("title", ""), "url": doc.get("url", "")} for doc in relevant_docs]
+            sources=create_sources_from_documents(relevant_docs)
         )
     except Exception as e:
         logger.error(f"Error generating AI response: {e}")
         return ChatResponse(
-            response="I apologize, but I'm having trouble processing your request right now. Please try again later.",
+            response=FALLBACK_RESPONSE,
+            session_id=session_id,
+            timestamp=datetime.now()
+        )
+
+async def stream_ai_response(
+    message: str,
+    session_id: str,
+    user_id: Optional[str] = None,
+    websocket: bool = False
+) -> AsyncIterator[Union[str, ChatResponse]]:
+    """Stream AI response chunks, finishing with the complete ChatResponse"""
+    try:
+        history, relevant_docs, context = await prepare_ai_request(message, session_id)
+        chunks = []
+        async for chunk in ollama_client.stream_response(
+            message=message,
+            context=context,
+            history=history,
+            priority=request_priority(user_id, websocket)
+        ):
+            chunks.append(chunk)
+            yield chunk
+        ai_response = "".join(chunks)
+        # Update conversation history
+        await chat_manager.add_messages(session_id, [("user", message), ("assistant", ai_response)])
+        yield ChatResponse(
+            response=ai_response,
+            session_id=session_id,
+            timestamp=datetime.now(),
+            sources=create_sources_from_documents(relevant_docs)
+        )
+    except Exception as e:
+        logger.error(f"Error streaming AI response: {e}")
+        yield ChatResponse(
+            response=FALLBACK_RESPONSE,
             session_id=session_id,
             timestamp=datetime.now()
         )
 
-def create_context_from_documents(documents: List[Dict[str, Any]]) -> str:
-    """Create context string from relevant documents"""
+async def prepare_ai_request(message: str, session_id: str):
+    """Gather conversation history and retrieved context for a message"""
+    # Get conversation history
+    history = await chat_manager.get_conversation_history(session_id)
+    # Search website passages for relevant information
+    relevant_docs = website_scraper.search(message, max_results=settings.max_search_results)
+    # Create context blocks from relevant documents, best match first
+    context = create_context_from_documents(relevant_docs)
+    return history, relevant_docs, context
+
+def create_sources_from_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Create the sources list, one entry per originating page"""
+    sources = {}
+    for doc in documents:
+        url = doc.get("url", "")
+        if url not in sources:
+            sources[url] = {"title": doc.get("title", ""), "url": url}
+    return list(sources.values())
+
+def create_context_from_documents(documents: List[Dict[str, Any]]) -> List[str]:
+    """Create one context block per relevant document, in ranking order"""
     if not documents:
-        return ""
+        return []
     
     context_parts = []
     for doc in documents:
@@ -197,7 +385,7 @@ def create_context_from_documents(documents: List[Dict[str, Any]]) -> str:
         else:
             context_parts.append(f"Title: {title}\nURL: {url}\nContent: {content}\n")
     
-    return "\n".join(context_parts)
+    return context_parts
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,93 +1,298 @@
-import ollama
+import httpx
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional, Sequence, Tuple, Union
 from datetime import datetime
-import requests
 import os
 
+import numpy as np
+
+from config import settings
+from generation_scheduler import PRIORITY_ANONYMOUS_REST, AdmissionError, GenerationScheduler
+from ollama_pool import OllamaBackendPool
+from prompt_builder import BuiltPrompt, PromptBuilder
+from response_cache import ResponseCache, context_fingerprint
+from semantic_cache import SemanticCache
+from single_flight import SharedStream, SingleFlight
+
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """You are BigBikeBlitz AI Assistant for motorcycle e-commerce. Be concise, helpful, and accurate.
+
+Focus on:
+- Motorcycle specifications, prices, and features
+- Product comparisons and recommendations
+- BigBikeBlitz services (financing, warranty, delivery)
+- Technical motorcycle information
+
+Keep responses under 200 words unless detailed specs are requested."""
+
+GENERATION_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_tokens": 300, 
+    "num_predict": 300,
+    "top_k": 20,
+    "repeat_penalty": 1.1
+}
+
 class OllamaClient:
     def __init__(self, model_name: str = "llama3.2:1b"):
         self.model_name = model_name
         # self.base_url = os.getenv("OLLAMA_BASE_URL", "https://summit-projection-accessories-fwd.trycloudflare.com")
-        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        self.client = ollama.Client(host=self.base_url)
+        self.base_urls = [url.strip() for url in settings.ollama_base_urls.split(",") if url.strip()]
+        if not self.base_urls:
+            self.base_urls = [os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")]
+        self.pool = OllamaBackendPool(
+            base_urls=self.base_urls,
+            model_name=self.model_name,
+            timeout=httpx.Timeout(settings.ollama_timeout, connect=settings.ollama_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.ollama_max_connections,
+                max_keepalive_connections=settings.ollama_max_keepalive_connections,
+                keepalive_expiry=settings.ollama_keepalive_expiry
+            ),
+            max_attempts=settings.ollama_max_attempts,
+            health_options={
+                "interval": settings.ollama_health_interval,
+                "ttl": settings.ollama_health_ttl,
+                "failure_threshold": settings.ollama_failure_threshold,
+                "recovery_timeout": settings.ollama_recovery_timeout,
+            }
+        )
         self._model_loaded = False
-        self._response_cache = {}
+        self.response_cache = ResponseCache(
+            max_entries=settings.response_cache_max_entries,
+            max_bytes=settings.response_cache_max_bytes,
+            ttl=settings.response_cache_ttl
+        )
+        self.semantic_cache = SemanticCache(
+            embed=self._embed,
+            threshold=settings.semantic_cache_threshold,
+            max_entries=settings.semantic_cache_max_entries,
+            ttl=settings.semantic_cache_ttl
+        ) if settings.semantic_cache_enabled else None
+        self.single_flight = SingleFlight()
+        self.scheduler = GenerationScheduler(
+            max_in_flight=settings.generation_max_in_flight * len(self.pool),
+            max_queue=settings.generation_max_queue,
+            queue_timeout=settings.generation_queue_timeout
+        )
+        self.prompt_builder = PromptBuilder(
+            system_prompt=SYSTEM_PROMPT,
+            token_budget=settings.prompt_token_budget,
+            context_share=settings.prompt_context_share,
+            max_history_messages=settings.prompt_max_history_messages
+        )
+    
+    async def start(self):
+        """Start background health monitoring of every backend"""
+        await self.pool.start()
+    
+    async def is_available(self) -> bool:
+        """Read the cached health state, probing once if nothing has been checked yet"""
+        if not self.pool.checked:
+            await self.pool.check_now()
+        return self.pool.is_available
         
     async def check_health(self) -> bool:
-        """Check if Ollama is running and model is available"""
-        try:
-            # Check if Ollama is running (use / endpoint)
-            response = requests.get(f"{self.base_url}/", timeout=3)
-            if response.status_code != 200 or "Ollama is running" not in response.text:
-                logger.error(f"Ollama health check failed: Unexpected response: {response.text}")
-                return False
-            # Check if model is available
-            models = self.client.list()
-            model_names = [model['name'] for model in models['models']]
-            if self.model_name not in model_names:
-                logger.warning(f"Model {self.model_name} not found. Available models: {model_names}")
-                return False
-            return True
-        except Exception as e:
-            logger.error(f"Ollama health check failed: {e}")
+        """Probe every backend directly, True if any has the model available"""
+        healthy = await self.pool.check_now()
+        if not healthy:
             logger.info("Running in demo mode - using predefined responses")
-            return False
+        return healthy
     
     async def generate_response(
         self, 
         message: str, 
-        context: str = "", 
-        history: Optional[List[Dict[str, str]]] = None
+        context: Union[str, Sequence[str]] = "", 
+        history: Optional[List[Dict[str, str]]] = None,
+        priority: int = PRIORITY_ANONYMOUS_REST
     ) -> str:
         """Generate response using Llama 3.2 1B with caching and timeout"""
         try:
             # Check cache first for common queries
-            cache_key = message.lower().strip()
-            if cache_key in self._response_cache:
+            cache_key = self.response_cache.make_key(message, context, history)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
                 logger.info("Using cached response")
-                return self._response_cache[cache_key]
+                return cached
             
             # Check if we're in demo mode or Ollama is not available
-            if not await self.check_health():
+            if not await self.is_available():
                 return self._generate_demo_response(message, context)
             
-            # Prepare system prompt
-            system_prompt = self._create_system_prompt(context)
-            
-            # Prepare conversation
-            messages = self._prepare_messages(system_prompt, message, history or [])
-            
-            # Generate response without timeout
-            response = await asyncio.to_thread(
-                self.client.chat,
-                model=self.model_name,
-                messages=messages,
-                options={
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 300, 
-                    "num_predict": 300,
-                    "top_k": 20,
-                    "repeat_penalty": 1.1
-                }
+            # Identical concurrent questions share one generation
+            return await self.single_flight.do(
+                cache_key,
+                lambda: self._generate_uncached(cache_key, message, context, history, priority)
             )
             
-            response_text = response['message']['content']
-            
-            # Cache the response for future use
-            self._response_cache[cache_key] = response_text
-            
-            return response_text
-            
+        except AdmissionError as e:
+            logger.warning(f"Generation not admitted, using demo response: {e}")
+            return self._generate_demo_response(message, context)
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return self._generate_demo_response(message, context)
     
-    def _generate_demo_response(self, message: str, context: str = "") -> str:
+    async def _generate_uncached(
+        self,
+        cache_key: str,
+        message: str,
+        context: Union[str, Sequence[str]],
+        history: Optional[List[Dict[str, str]]],
+        priority: int
+    ) -> str:
+        """Run one generation and cache its result"""
+        # Near-duplicate questions can reuse an answer without running the chat model
+        embedding, similar = await self._semantic_lookup(message, context, history)
+        if similar is not None:
+            self.response_cache.set(cache_key, similar)
+            return similar
+        
+        # Pack system prompt, context and history into the token budget
+        prompt = self.build_prompt(message, context, history)
+        
+        async with self.scheduler.slot(priority):
+            # Generate on the least loaded backend (bounded by settings.ollama_timeout per read)
+            response = await self.pool.chat(
+                model=self.model_name,
+                messages=prompt.messages,
+                options=GENERATION_OPTIONS
+            )
+        
+        response_text = response['message']['content']
+        
+        # Cache the response for future use
+        self._store_response(cache_key, embedding, message, context, response_text)
+        
+        return response_text
+    
+    async def stream_response(
+        self, 
+        message: str, 
+        context: Union[str, Sequence[str]] = "", 
+        history: Optional[List[Dict[str, str]]] = None,
+        priority: int = PRIORITY_ANONYMOUS_REST
+    ) -> AsyncIterator[str]:
+        """Stream a response chunk by chunk as Ollama produces it"""
+        cache_key = self.response_cache.make_key(message, context, history)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Using cached response")
+            yield cached
+            return
+        
+        if not await self.is_available():
+            yield self._generate_demo_response(message, context)
+            return
+        
+        # Identical concurrent questions share one generation: replay its stream, or await a non-streaming one
+        if not self.single_flight.streaming(cache_key):
+            in_flight = self.single_flight.join(cache_key)
+            if in_flight is not None:
+                try:
+                    yield await in_flight
+                    return
+                except Exception as e:
+                    logger.error(f"Error in shared generation: {e}")
+                    yield self._generate_demo_response(message, context)
+                    return
+        shared = self.single_flight.stream(
+            cache_key,
+            lambda stream: self._stream_uncached(stream, cache_key, message, context, history, priority)
+        )
+        
+        yielded = False
+        try:
+            async for chunk in shared.replay():
+                yielded = True
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error in shared stream: {e}")
+            if not yielded:
+                yield self._generate_demo_response(message, context)
+    
+    async def _stream_uncached(
+        self,
+        stream: SharedStream,
+        cache_key: str,
+        message: str,
+        context: Union[str, Sequence[str]],
+        history: Optional[List[Dict[str, str]]],
+        priority: int
+    ) -> str:
+        """Run one streamed generation, pushing chunks to every caller sharing it, and cache its result"""
+        embedding, similar = await self._semantic_lookup(message, context, history)
+        if similar is not None:
+            self.response_cache.set(cache_key, similar)
+            stream.push(similar)
+            return similar
+        
+        prompt = self.build_prompt(message, context, history)
+        try:
+            await self.scheduler.acquire(priority)
+        except AdmissionError as e:
+            logger.warning(f"Generation not admitted, using demo response: {e}")
+            stream.push(self._generate_demo_response(message, context))
+            return "".join(stream.chunks)
+        
+        try:
+            async for chunk in self.pool.stream_chat(
+                model=self.model_name,
+                messages=prompt.messages,
+                options=GENERATION_OPTIONS
+            ):
+                stream.push(chunk)
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            if not stream.chunks:
+                stream.push(self._generate_demo_response(message, context))
+            return "".join(stream.chunks)
+        finally:
+            self.scheduler.release()
+        
+        response_text = "".join(stream.chunks)
+        self._store_response(cache_key, embedding, message, context, response_text)
+        return response_text
+    
+    async def _embed(self, text: str) -> Sequence[float]:
+        """Embed text with the local Ollama embedding model"""
+        response = await self.pool.embeddings(model=settings.semantic_cache_embedding_model, prompt=text)
+        return response['embedding']
+    
+    async def _semantic_lookup(
+        self,
+        message: str,
+        context: Union[str, Sequence[str]],
+        history: Optional[List[Dict[str, str]]]
+    ) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Embed a standalone question and look for a cached answer to a near-duplicate"""
+        # Follow-up questions depend on the conversation, so only first turns are matched
+        if self.semantic_cache is None or history:
+            return None, None
+        embedding = await self.semantic_cache.embed(message)
+        # Only answers generated from the same retrieved passages count, so a re-crawl invalidates them
+        match = self.semantic_cache.search(embedding, context_fingerprint(context))
+        if match is None:
+            return embedding, None
+        logger.info(f"Using semantically cached response (similarity {match[1]:.3f})")
+        return embedding, match[0]
+    
+    def _store_response(
+        self,
+        cache_key: str,
+        embedding: Optional[np.ndarray],
+        message: str,
+        context: Union[str, Sequence[str]],
+        response_text: str
+    ):
+        """Store a fresh generation in the exact and semantic caches"""
+        self.response_cache.set(cache_key, response_text)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(embedding, message, response_text, context_fingerprint(context))
+    
+    def _generate_demo_response(self, message: str, context: Union[str, Sequence[str]] = "") -> str:
         """Generate demo responses when AI model is not available"""
         message_lower = message.lower()
         
@@ -113,46 +318,20 @@ class OllamaClient:
         else:
             return "Thank you for your interest in BigBikeBlitz! I'm here to help you find the perfect motorcycle. We offer a wide selection of BMW, Honda, Yamaha, Kawasaki, and Suzuki bikes. What specific information are you looking for?"
     
-    def _create_system_prompt(self, context: str) -> str:
-        """Create system prompt with BigBikeBlitz context"""
-        base_prompt = """You are BigBikeBlitz AI Assistant for motorcycle e-commerce. Be concise, helpful, and accurate.
-
-Focus on:
-- Motorcycle specifications, prices, and features
-- Product comparisons and recommendations
-- BigBikeBlitz services (financing, warranty, delivery)
-- Technical motorcycle information
-
-Keep responses under 200 words unless detailed specs are requested."""
-        
-        if context:
-            base_prompt += f"\n\nRelevant product info:\n{context}"
-        
-        return base_prompt
-    
-    def _prepare_messages(
-        self, 
-        system_prompt: str, 
-        user_message: str, 
-        history: List[Dict[str, str]]
-    ) -> List[Dict[str, str]]:
-        """Prepare messages for Ollama API"""
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history
-        for msg in history[-10:]:  # Limit to last 10 messages
-            messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        # Add current user message
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
-        
-        return messages
+    def build_prompt(
+        self,
+        message: str,
+        context: Union[str, Sequence[str]] = "",
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> BuiltPrompt:
+        """Build the token-budgeted message list for a generation"""
+        prompt = self.prompt_builder.build(message, context, history or [])
+        logger.debug(
+            f"Prompt packed to ~{prompt.token_count} tokens "
+            f"({prompt.context_blocks} context blocks, {prompt.history_messages} history messages, "
+            f"dropped {prompt.dropped_context_blocks} blocks and {prompt.dropped_history_messages} messages)"
+        )
+        return prompt
     
     async def test_model(self) -> bool:
         """Test the model with a simple query"""
@@ -169,7 +348,7 @@ Keep responses under 200 words unless detailed specs are requested."""
     async def get_model_info(self) -> Dict[str, Any]:
         """Get information about the loaded model"""
         try:
-            models = self.client.list()
+            models = await self.pool.list_models()
             for model in models['models']:
                 if model['name'] == self.model_name:
                     return {
@@ -181,4 +360,8 @@ Keep responses under 200 words unless detailed specs are requested."""
             return {"error": "Model not found"}
         except Exception as e:
             logger.error(f"Error getting model info: {e}")
-            return {"error": str(e)} 
+            return {"error": str(e)}
+    
+    async def close(self):
+        """Stop health monitoring and close pooled connections to Ollama"""
+        await self.pool.close()
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence
+
+import httpx
+import ollama
+
+from health_monitor import HealthMonitor
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailableError(Exception):
+    """Every Ollama backend is unhealthy or has already failed this request"""
+
+
+class OllamaBackend:
+    """One Ollama server: its pooled client, health monitor and load counters"""
+
+    def __init__(
+        self,
+        base_url: str,
+        model_name: str,
+        timeout: httpx.Timeout,
+        limits: httpx.Limits,
+        health_options: Optional[Dict[str, Any]] = None
+    ):
+        self.base_url = base_url
+        self.model_name = model_name
+        # One AsyncClient per backend: its httpx pool keeps connections alive across requests
+        self.client = ollama.AsyncClient(host=base_url, timeout=timeout, limits=limits)
+        self.health = HealthMonitor(
+            probe=self.check_health,
+            name=f"Ollama at {base_url}",
+            **(health_options or {})
+        )
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    async def check_health(self) -> bool:
+        """Probe the server directly and check the model is available"""
+        try:
+            # Listing models proves Ollama is reachable and tells us if the model is pulled
+            models = await self.client.list()
+            model_names = [model['name'] for model in models['models']]
+            if self.model_name not in model_names:
+                logger.warning(f"Model {self.model_name} not found on {self.base_url}. Available models: {model_names}")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Ollama health check failed for {self.base_url}: {e}")
+            return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Health and load state for the health endpoint"""
+        return {
+            "url": self.base_url,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            **self.health.snapshot(),
+        }
+
+    async def close(self):
+        await self.health.stop()
+        # ollama.AsyncClient has no public close; its connections live on the httpx client it builds
+        http_client = getattr(self.client, "_client", None)
+        if isinstance(http_client, httpx.AsyncClient):
+            await http_client.aclose()
+
+
+class OllamaBackendPool:
+    """Routes Ollama calls across several servers.
+
+    Each call goes to the healthy backend with the fewest outstanding
+    requests. If it fails, the call is retried on a different backend, up to
+    `max_attempts` backends in total. Streams are only retried if they fail
+    before the first chunk has been handed to the caller.
+    """
+
+    def __init__(
+        self,
+        base_urls: Sequence[str],
+        model_name: str,
+        timeout: httpx.Timeout,
+        limits: httpx.Limits,
+        max_attempts: int = 2,
+        health_options: Optional[Dict[str, Any]] = None
+    ):
+        self.backends = [
+            OllamaBackend(url, model_name, timeout, limits, health_options)
+            for url in base_urls
+        ]
+        self.max_attempts = max_attempts
+        self.retries = 0
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    @property
+    def checked(self) -> bool:
+        """Whether every backend has been probed at least once"""
+        return all(backend.health.last_checked is not None for backend in self.backends)
+
+    @property
+    def is_available(self) -> bool:
+        """At least one backend is healthy"""
+        return any(backend.health.is_available for backend in self.backends)
+
+    async def start(self):
+        """Probe every backend and start their background health monitors"""
+        await asyncio.gather(*(backend.health.start() for backend in self.backends))
+
+    async def check_now(self) -> bool:
+        """Probe every backend immediately, True if any is healthy"""
+        results = await asyncio.gather(*(backend.health.check_now() for backend in self.backends))
+        return any(results)
+
+    def pick(self, exclude: Sequence[OllamaBackend] = ()) -> Optional[OllamaBackend]:
+        """Least-outstanding-requests choice among healthy backends not yet tried"""
+        candidates = [
+            backend for backend in self.backends
+            if backend.health.is_available and backend not in exclude
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda backend: backend.outstanding)
+
+    async def chat(self, **kwargs) -> Mapping[str, Any]:
+        """Non-streaming chat on the least loaded backend, failing over on errors"""
+        return await self._request("chat", **kwargs)
+
+    async def embeddings(self, **kwargs) -> Mapping[str, Any]:
+        """Embeddings from the least loaded backend, failing over on errors"""
+        return await self._request("embeddings", **kwargs)
+
+    async def _request(self, method: str, **kwargs) -> Mapping[str, Any]:
+        tried: List[OllamaBackend] = []
+        last_error: Optional[Exception] = None
+        while len(tried) < self.max_attempts:
+            backend = self.pick(tried)
+            if backend is None:
+                break
+            if tried:
+                self.retries += 1
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.requests += 1
+            try:
+                response = await getattr(backend.client, method)(**kwargs)
+            except Exception as e:
+                backend.failures += 1
+                backend.health.record_failure(str(e))
+                logger.warning(f"{method.capitalize()} failed on {backend.base_url}: {e}")
+                last_error = e
+                continue
+            finally:
+                backend.outstanding -= 1
+            backend.health.record_success()
+            return response
+        raise last_error or NoBackendAvailableError("No healthy Ollama backend available")
+
+    async def stream_chat(self, **kwargs) -> AsyncIterator[str]:
+        """Streaming chat yielding content chunks, failing over until the first chunk arrives"""
+        tried: List[OllamaBackend] = []
+        last_error: Optional[Exception] = None
+        while len(tried) < self.max_attempts:
+            backend = self.pick(tried)
+            if backend is None:
+                break
+            if tried:
+                self.retries += 1
+            tried.append(backend)
+            backend.outstanding += 1
+            backend.requests += 1
+            started = False
+            try:
+                async for part in await backend.client.chat(stream=True, **kwargs):
+                    chunk = part['message']['content']
+                    if chunk:
+                        started = True
+                        yield chunk
+            except Exception as e:
+                backend.failures += 1
+                backend.health.record_failure(str(e))
+                logger.warning(f"Streaming chat failed on {backend.base_url}: {e}")
+                if started:
+                    raise
+                last_error = e
+                continue
+            finally:
+                backend.outstanding -= 1
+            backend.health.record_success()
+            return
+        raise last_error or NoBackendAvailableError("No healthy Ollama backend available")
+
+    async def list_models(self) -> Mapping[str, Any]:
+        """Model listing from the first healthy backend, or the first backend if none is"""
+        backend = self.pick() or self.backends[0]
+        return await backend.client.list()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-backend health and load for the health endpoint"""
+        return {
+            "available": self.is_available,
+            "retries": self.retries,
+            "backends": [backend.snapshot() for backend in self.backends],
+        }
+
+    async def close(self):
+        """Stop health monitors and close every backend's connections"""
+        await asyncio.gather(*(backend.close() for backend in self.backends))
@@ -0,0 +1,358 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+import asyncpg
+
+from storage import (
+    ALL_TIME_BUCKET,
+    TABLE_COLUMNS,
+    RollupDelta,
+    Rows,
+    StorageBackend,
+    count_distinct_users,
+    top_queries,
+)
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that stops replicas migrating at the same time
+MIGRATION_LOCK_KEY = 0x4242_4c49
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+async def apply_rollups(conn: asyncpg.Connection, delta: RollupDelta):
+    """Fold a rollup delta into the rollup tables, inside the caller's transaction"""
+    # Rows are touched in sorted order so concurrent replicas lock them in the same order
+    if delta.conversation_counts:
+        await conn.executemany("""
+            INSERT INTO rollup_hourly_conversations AS r (hour, conversations) VALUES ($1, $2)
+            ON CONFLICT (hour) DO UPDATE SET conversations = r.conversations + EXCLUDED.conversations
+        """, sorted(delta.conversation_counts.items()))
+    if delta.event_counts:
+        await conn.executemany("""
+            INSERT INTO rollup_hourly_events AS r (hour, event_type, count) VALUES ($1, $2, $3)
+            ON CONFLICT (hour, event_type) DO UPDATE SET count = r.count + EXCLUDED.count
+        """, sorted((hour, event_type, count) for (hour, event_type), count in delta.event_counts.items()))
+
+    # Several replicas may write at once, so each sketch row is locked for its read-merge-write
+    for bucket in sorted(delta.sketch_rows):
+        await conn.execute(
+            "INSERT INTO rollup_sketches (bucket) VALUES ($1) ON CONFLICT (bucket) DO NOTHING", bucket
+        )
+        row = await conn.fetchrow(
+            "SELECT users_hll, top_queries FROM rollup_sketches WHERE bucket = $1 FOR UPDATE", bucket
+        )
+        users_hll, queries = delta.merge_sketches(bucket, row["users_hll"], row["top_queries"])
+        await conn.execute(
+            "UPDATE rollup_sketches SET users_hll = $2, top_queries = $3 WHERE bucket = $1",
+            bucket, users_hll, queries
+        )
+
+
+async def _backfill_rollups(conn: asyncpg.Connection, chunk_size: int = 1000):
+    """Build the rollups from rows written before they existed"""
+    chunk = []
+    async for row in conn.cursor("SELECT created_at, user_id, user_message FROM conversations ORDER BY id", prefetch=chunk_size):
+        chunk.append((row["created_at"], row["user_id"], row["user_message"]))
+        if len(chunk) >= chunk_size:
+            await apply_rollups(conn, RollupDelta(chunk, []))
+            chunk = []
+    if chunk:
+        await apply_rollups(conn, RollupDelta(chunk, []))
+
+    chunk = []
+    async for row in conn.cursor("SELECT created_at, event_type FROM analytics ORDER BY id", prefetch=chunk_size):
+        chunk.append((row["created_at"], row["event_type"]))
+        if len(chunk) >= chunk_size:
+            await apply_rollups(conn, RollupDelta([], chunk))
+            chunk = []
+    if chunk:
+        await apply_rollups(conn, RollupDelta([], chunk))
+
+
+MigrationStep = Union[str, Callable[[asyncpg.Connection], Awaitable[None]]]
+
+# Same versions as the SQLite schema history, in PostgreSQL's dialect. Timestamps
+# are stored as naive UTC to match SQLite's CURRENT_TIMESTAMP.
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id BIGSERIAL PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            user_id TEXT,
+            user_message TEXT NOT NULL,
+            ai_response TEXT NOT NULL,
+            sources TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS analytics (
+            id BIGSERIAL PRIMARY KEY,
+            event_type TEXT NOT NULL,
+            session_id TEXT,
+            user_id TEXT,
+            data TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS knowledge_base_logs (
+            id BIGSERIAL PRIMARY KEY,
+            action TEXT NOT NULL,
+            document_url TEXT,
+            document_title TEXT,
+            status TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        """,
+    ]),
+    (2, "time and session indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_session_created ON conversations (session_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_created_user ON conversations (created_at, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_created ON analytics (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_event_created ON analytics (event_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_base_logs_created ON knowledge_base_logs (created_at)",
+    ]),
+    (3, "full-text search over conversations", [
+        # A stored generated column is computed for existing rows too, so no separate backfill
+        """
+        ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', user_message || ' ' || ai_response)) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversations_search ON conversations USING GIN (search_vector)",
+    ]),
+    (4, "analytics rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS rollup_hourly_conversations (
+            hour TEXT PRIMARY KEY,
+            conversations BIGINT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_hourly_events (
+            hour TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            count BIGINT NOT NULL,
+            PRIMARY KEY (hour, event_type)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_sketches (
+            bucket TEXT PRIMARY KEY,
+            users_hll BYTEA,
+            top_queries TEXT
+        )
+        """,
+        _backfill_rollups,
+    ]),
+]
+
+
+def _split_password(dsn: str) -> Tuple[str, Dict[str, str]]:
+    """Move a password out of a postgres:// URL into PGPASSWORD, so it doesn't show up in process listings"""
+    env = dict(os.environ)
+    parts = urlsplit(dsn)
+    if parts.password is None:
+        return dsn, env
+    env["PGPASSWORD"] = unquote(parts.password)
+    userinfo, _, hostinfo = parts.netloc.rpartition("@")
+    netloc = f"{userinfo.split(':', 1)[0]}@{hostinfo}"
+    return urlunsplit(parts._replace(netloc=netloc)), env
+
+
+def pg_tsquery(query: str) -> str:
+    """Turn free text into a tsquery: every word must match, the last one as a prefix"""
+    terms = WORD_PATTERN.findall(query)
+    if not terms:
+        return ""
+    terms[-1] += ":*"
+    return " & ".join(terms)
+
+
+def _timestamp(value: datetime) -> str:
+    """Format timestamps the way SQLite returns them"""
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class PostgresStorage(StorageBackend):
+    """PostgreSQL storage over an asyncpg connection pool, with COPY for batched inserts"""
+
+    def __init__(self, dsn: str, min_pool_size: int = 1, max_pool_size: int = 10, pg_dump_path: str = "pg_dump"):
+        self.dsn = dsn
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        self.pg_dump_path = pg_dump_path
+        self._pool: Optional[asyncpg.Pool] = None
+
+    async def initialize(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_pool_size,
+                max_size=self.max_pool_size
+            )
+        await self._migrate()
+
+    async def _migrate(self):
+        """Apply every migration newer than the database's recorded schema version"""
+        async with self._pool.acquire() as conn:
+            await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+            try:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                    )
+                """)
+                current = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+                for version, description, statements in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    # Each migration is applied atomically together with its version record
+                    async with conn.transaction():
+                        for step in statements:
+                            if callable(step):
+                                await step(conn)
+                            else:
+                                await conn.execute(step)
+                        await conn.execute(
+                            "INSERT INTO schema_migrations (version, description) VALUES ($1, $2)",
+                            version, description
+                        )
+                    logger.info(f"Applied database migration {version}: {description}")
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+
+    async def schema_version(self) -> int:
+        return await self._pool.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+    async def write_batch(self, rows_by_table: Dict[str, Rows], written_at: datetime):
+        """COPY each table's rows in, committing them and their rollups together"""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                for table, rows in rows_by_table.items():
+                    await conn.copy_records_to_table(table, records=rows, columns=TABLE_COLUMNS[table])
+                await apply_rollups(conn, RollupDelta.from_batch(rows_by_table, written_at))
+
+    async def get_conversation_history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await self._pool.fetch("""
+            SELECT id, session_id, user_id, user_message, ai_response, sources, created_at
+            FROM conversations
+            WHERE session_id = $1
+            ORDER BY created_at DESC
+            LIMIT $2
+        """, session_id, limit)
+        return [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "user_id": row["user_id"],
+                "user_message": row["user_message"],
+                "ai_response": row["ai_response"],
+                "sources": json.loads(row["sources"]) if row["sources"] else [],
+                "created_at": _timestamp(row["created_at"])
+            }
+            for row in rows
+        ]
+
+    async def get_analytics_summary(self, days: int) -> Dict[str, Any]:
+        since = datetime.utcnow() - timedelta(days=days)
+        hour = since.strftime("%Y-%m-%d %H:00:00")
+
+        total_conversations = await self._pool.fetchval(
+            "SELECT COALESCE(SUM(conversations), 0) FROM rollup_hourly_conversations WHERE hour >= $1",
+            hour
+        )
+        sketches = await self._pool.fetch(
+            "SELECT users_hll FROM rollup_sketches WHERE bucket != $1 AND bucket >= $2",
+            ALL_TIME_BUCKET, since.strftime("%Y-%m-%d")
+        )
+        events = await self._pool.fetch("""
+            SELECT event_type, SUM(count) AS count FROM rollup_hourly_events
+            WHERE hour >= $1
+            GROUP BY event_type
+        """, hour)
+
+        return {
+            "period_days": days,
+            "total_conversations": int(total_conversations),
+            "unique_users": count_distinct_users([row["users_hll"] for row in sketches]),
+            "event_counts": {row["event_type"]: int(row["count"]) for row in events}
+        }
+
+    async def get_popular_queries(self, limit: int) -> List[Dict[str, Any]]:
+        data = await self._pool.fetchval(
+            "SELECT top_queries FROM rollup_sketches WHERE bucket = $1", ALL_TIME_BUCKET
+        )
+        return top_queries(data, limit)
+
+    async def search_conversations(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        tsquery = pg_tsquery(query)
+        if not tsquery:
+            return []
+        rows = await self._pool.fetch("""
+            SELECT c.id, c.session_id, c.user_id, c.user_message, c.ai_response, c.created_at,
+                   ts_headline('english', c.user_message || ' ' || c.ai_response, q,
+                               'StartSel=[, StopSel=], MaxWords=16, MinWords=6') AS snippet,
+                   ts_rank_cd(c.search_vector, q) AS score
+            FROM conversations c, to_tsquery('english', $1) q
+            WHERE c.search_vector @@ q
+            ORDER BY score DESC
+            LIMIT $2
+        """, tsquery, limit)
+        return [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "user_id": row["user_id"],
+                "user_message": row["user_message"],
+                "ai_response": row["ai_response"],
+                "created_at": _timestamp(row["created_at"]),
+                "snippet": row["snippet"],
+                "score": row["score"]
+            }
+            for row in rows
+        ]
+
+    async def delete_expired(self, table: str, days: int, limit: int) -> int:
+        status = await self._pool.execute(f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table}
+                WHERE created_at < $1
+                LIMIT $2
+            )
+        """, datetime.utcnow() - timedelta(days=days), limit)
+        # asyncpg returns the command tag, e.g. "DELETE 500"
+        return int(status.split()[-1])
+
+    async def backup(self, backup_path: str):
+        """Dump the database with pg_dump in its custom format, restorable with pg_restore.
+
+        pg_dump reads from one snapshot, so the copy is consistent while writers carry on.
+        """
+        dsn, env = _split_password(self.dsn)
+        process = await asyncio.create_subprocess_exec(
+            self.pg_dump_path, "--format=custom", f"--file={backup_path}", f"--dbname={dsn}",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"pg_dump exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
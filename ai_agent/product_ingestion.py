@@ -0,0 +1,153 @@
+import asyncio
+import re
+import threading
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+HORSEPOWER_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:hp|bhp|ps|horsepower)\b", re.IGNORECASE)
+
+
+def extract_horsepower(*texts: Optional[str]) -> str:
+    """First horsepower figure mentioned in any of the texts, e.g. '214 hp'"""
+    for text in texts:
+        match = HORSEPOWER_PATTERN.search(text or "")
+        if match:
+            return f"{match.group(1)} hp"
+    return ""
+
+
+def format_price(price: Any) -> str:
+    if price is None or price == "":
+        return ""
+    try:
+        return f"${float(price):,.0f}"
+    except (TypeError, ValueError):
+        return str(price)
+
+
+def bike_to_document(bike: Dict[str, Any], site_url: str) -> Dict[str, Any]:
+    """Build the knowledge base document for one bike from the backend's JSON"""
+    brand = (bike.get("brand") or "").strip()
+    name = (bike.get("name") or "").strip()
+    # Names usually repeat the brand ("Ducati Panigale V4"); the model is what follows it
+    model = name[len(brand):].strip() if brand and name.lower().startswith(brand.lower()) else name
+    price = format_price(bike.get("price"))
+    engine_size = (bike.get("capacity") or "").strip()
+    horsepower = extract_horsepower(bike.get("technology"), bike.get("description"))
+
+    lines = [
+        f"{brand} {model}".strip(),
+        f"Type: {bike['type']}" if bike.get("type") else "",
+        f"Year: {bike['year']}" if bike.get("year") else "",
+        f"Price: {price}" if price else "",
+        f"Engine: {engine_size}" if engine_size else "",
+        f"Horsepower: {horsepower}" if horsepower else "",
+        f"Drive mode: {bike['driveMode']}" if bike.get("driveMode") else "",
+        f"Technology: {bike['technology']}" if bike.get("technology") else "",
+        bike.get("description") or "",
+    ]
+    return {
+        "url": f"{site_url.rstrip('/')}/product/{bike['id']}",
+        "title": name or f"{brand} {model}".strip(),
+        "content": "\n".join(line for line in lines if line),
+        "metadata": {
+            "type": "product",
+            "source": "api",
+            "bike_id": bike["id"],
+            "brand": brand,
+            "model": model,
+            "price": price,
+            "engine_size": engine_size,
+            "horsepower": horsepower,
+            "bike_type": bike.get("type") or "",
+            "year": bike.get("year") or "",
+            "image": bike.get("image") or "",
+        },
+    }
+
+
+class ProductFeed:
+    """Fetches the bike catalogue from the backend API without a browser.
+
+    Sends the ETag / Last-Modified validators from the previous fetch, so an
+    unchanged catalogue costs one 304. Accepts either a plain JSON list or a
+    Spring Data page ({"content": [...], "totalPages": n}); for pages, the
+    first response says how many there are and the rest are fetched
+    concurrently.
+    """
+
+    def __init__(self, api_url: str, site_url: str, page_size: int = 100, timeout: float = 10.0):
+        self.api_url = api_url
+        self.site_url = site_url
+        self.page_size = page_size
+        self.timeout = timeout
+        self.validators: Dict[str, str] = {}
+
+    def _conditional_headers(self) -> Dict[str, str]:
+        headers = {"Accept": "application/json"}
+        if self.validators.get("etag"):
+            headers["If-None-Match"] = self.validators["etag"]
+        if self.validators.get("last_modified"):
+            headers["If-Modified-Since"] = self.validators["last_modified"]
+        return headers
+
+    async def fetch(self) -> Optional[List[Dict[str, Any]]]:
+        """Product documents for the whole catalogue, or None if it is unchanged since the last fetch"""
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            # Paging parameters are harmless to an endpoint that returns a plain list
+            first = await client.get(
+                self.api_url,
+                params={"page": 0, "size": self.page_size},
+                headers=self._conditional_headers()
+            )
+            if first.status_code == 304:
+                return None
+            first.raise_for_status()
+            body = first.json()
+
+            if isinstance(body, list):
+                bikes = body
+            else:
+                bikes = list(body.get("content", []))
+                total_pages = body.get("totalPages", 1)
+                if total_pages > 1:
+                    size = body.get("size") or self.page_size
+                    pages = await asyncio.gather(*(
+                        client.get(self.api_url, params={"page": page, "size": size})
+                        for page in range(1, total_pages)
+                    ))
+                    for page in pages:
+                        page.raise_for_status()
+                        bikes.extend(page.json().get("content", []))
+
+        self.validators = {
+            "etag": first.headers.get("ETag", ""),
+            "last_modified": first.headers.get("Last-Modified", ""),
+        }
+        return [bike_to_document(bike, self.site_url) for bike in bikes if bike.get("id") is not None]
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a coroutine from synchronous code, even when called from inside a running event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result: Dict[str, Tuple[bool, Any]] = {}
+
+    def runner():
+        try:
+            result["value"] = (True, asyncio.run(coro))
+        except BaseException as e:
+            result["value"] = (False, e)
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    ok, value = result["value"]
+    if not ok:
+        raise value
+    return value
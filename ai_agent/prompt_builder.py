@@ -0,0 +1,143 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Union
+
+# Rough llama-family ratios; close enough for budgeting without a real tokenizer
+CHARS_PER_TOKEN = 4
+TOKENS_PER_WORD = 4 / 3
+MESSAGE_OVERHEAD_TOKENS = 4
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the token count of a piece of text"""
+    if not text:
+        return 0
+    by_words = len(WORD_PATTERN.findall(text)) * TOKENS_PER_WORD
+    by_chars = len(text) / CHARS_PER_TOKEN
+    return math.ceil(max(by_words, by_chars))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text on a word boundary so it fits within max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:mid]) + " ...") <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + " ..." if low else ""
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[Dict[str, str]]
+    token_count: int
+    context_blocks: int = 0
+    history_messages: int = 0
+    dropped_context_blocks: int = 0
+    dropped_history_messages: int = 0
+    truncated: List[str] = field(default_factory=list)
+
+
+class PromptBuilder:
+    """Packs system prompt, retrieved context and chat history into a token budget.
+
+    Priority order is: system prompt and current user message (always kept),
+    retrieved context in rank order up to its share of the budget, then history
+    from newest to oldest. Oldest turns are the first to go.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: int = 1536,
+        context_share: float = 0.6,
+        max_history_messages: int = 10,
+        context_header: str = "Relevant product info:"
+    ):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.context_share = context_share
+        self.max_history_messages = max_history_messages
+        self.context_header = context_header
+
+    def build(
+        self,
+        user_message: str,
+        context: Union[str, Sequence[str]] = (),
+        history: Sequence[Dict[str, str]] = ()
+    ) -> BuiltPrompt:
+        """Assemble the chat messages for one generation"""
+        blocks = [context] if isinstance(context, str) else list(context)
+        blocks = [block for block in blocks if block and block.strip()]
+        truncated = []
+
+        # Mandatory parts: system prompt and the current user message
+        used = estimate_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        user_budget = max(self.token_budget - used - MESSAGE_OVERHEAD_TOKENS, 0)
+        if estimate_tokens(user_message) > user_budget:
+            user_message = truncate_to_tokens(user_message, user_budget)
+            truncated.append("user_message")
+        used += estimate_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+
+        # Retrieved context, best ranked first
+        header_tokens = estimate_tokens(self.context_header) + 1
+        context_budget = min(
+            int(self.token_budget * self.context_share),
+            self.token_budget - used
+        ) - header_tokens
+        packed_blocks = []
+        context_used = 0
+        for block in blocks:
+            block_tokens = estimate_tokens(block) + 1
+            if context_used + block_tokens > context_budget:
+                if not packed_blocks and context_budget - context_used > 0:
+                    # Better a trimmed top hit than no context at all
+                    block = truncate_to_tokens(block, context_budget - context_used - 1)
+                    if block:
+                        packed_blocks.append(block)
+                        context_used += estimate_tokens(block) + 1
+                        truncated.append("context")
+                break
+            packed_blocks.append(block)
+            context_used += block_tokens
+        if packed_blocks:
+            used += header_tokens + context_used
+
+        # History, newest first, keeping a contiguous tail of the conversation
+        recent_history = list(history)[-self.max_history_messages:] if self.max_history_messages else []
+        packed_history = []
+        for msg in reversed(recent_history):
+            msg_tokens = estimate_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if used + msg_tokens > self.token_budget:
+                break
+            packed_history.append({"role": msg["role"], "content": msg["content"]})
+            used += msg_tokens
+        packed_history.reverse()
+
+        system_content = self.system_prompt
+        if packed_blocks:
+            system_content += f"\n\n{self.context_header}\n" + "\n".join(packed_blocks)
+
+        messages = [{"role": "system", "content": system_content}]
+        messages.extend(packed_history)
+        messages.append({"role": "user", "content": user_message})
+
+        return BuiltPrompt(
+            messages=messages,
+            token_count=sum(estimate_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in messages),
+            context_blocks=len(packed_blocks),
+            history_messages=len(packed_history),
+            dropped_context_blocks=len(blocks) - len(packed_blocks),
+            dropped_history_messages=len(history) - len(packed_history),
+            truncated=truncated
+        )
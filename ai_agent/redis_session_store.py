@@ -0,0 +1,101 @@
+import json
+import time
+from typing import Dict, Iterable, List, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+
+from session_store import Message, SessionStore
+
+KEY_PREFIX = "bbb:chat:"
+# Sorted set of session ids scored by last activity
+SESSIONS_KEY = KEY_PREFIX + "sessions"
+# Hash of user_id -> session_id
+USER_SESSIONS_KEY = KEY_PREFIX + "user_sessions"
+
+
+def _history_key(session_id: str) -> str:
+    return f"{KEY_PREFIX}history:{session_id}"
+
+
+def _session_user_key(session_id: str) -> str:
+    return f"{KEY_PREFIX}session_user:{session_id}"
+
+
+class RedisSessionStore(SessionStore):
+    """Store in Redis, shared by every worker and host.
+
+    Each session's history is a capped list; an append is one pipelined round
+    trip (RPUSH, LTRIM, ZADD).
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0"):
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def load_history(self, session_id: str) -> Optional[List[Message]]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zscore(SESSIONS_KEY, session_id)
+            pipe.lrange(_history_key(session_id), 0, -1)
+            active, items = await pipe.execute()
+        if active is None:
+            return None
+        return [json.loads(item) for item in items]
+
+    async def append_messages(self, session_id: str, messages: List[Message], max_messages: int):
+        key = _history_key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(json.dumps(message) for message in messages))
+            pipe.ltrim(key, -max_messages, -1)
+            pipe.zadd(SESSIONS_KEY, {session_id: time.time()})
+            await pipe.execute()
+
+    async def delete_session(self, session_id: str):
+        user_key = _session_user_key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # Only unlink the user if this is still their session; they may have moved on since
+                    await pipe.watch(user_key, USER_SESSIONS_KEY)
+                    user_id = await pipe.get(user_key)
+                    linked = await pipe.hget(USER_SESSIONS_KEY, user_id) if user_id else None
+                    pipe.multi()
+                    pipe.delete(_history_key(session_id), user_key)
+                    pipe.zrem(SESSIONS_KEY, session_id)
+                    if linked == session_id:
+                        pipe.hdel(USER_SESSIONS_KEY, user_id)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def set_user_session(self, user_id: str, session_id: str):
+        previous = await self.client.hget(USER_SESSIONS_KEY, user_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(USER_SESSIONS_KEY, user_id, session_id)
+            pipe.set(_session_user_key(session_id), user_id)
+            if previous and previous != session_id:
+                # The old session no longer belongs to the user's current link
+                pipe.delete(_session_user_key(previous))
+            pipe.zadd(SESSIONS_KEY, {session_id: time.time()})
+            await pipe.execute()
+
+    async def get_user_session(self, user_id: str) -> Optional[str]:
+        return await self.client.hget(USER_SESSIONS_KEY, user_id)
+
+    async def expire_sessions(self, older_than: float, keep: Iterable[str] = ()) -> List[str]:
+        keep = set(keep)
+        stale = await self.client.zrangebyscore(SESSIONS_KEY, "-inf", f"({older_than}")
+        expired = [session_id for session_id in stale if session_id not in keep]
+        for session_id in expired:
+            await self.delete_session(session_id)
+        return expired
+
+    async def counts(self) -> Dict[str, int]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zcard(SESSIONS_KEY)
+            pipe.hlen(USER_SESSIONS_KEY)
+            sessions, users = await pipe.execute()
+        return {"sessions": sessions, "users": users}
+
+    async def close(self):
+        await self.client.aclose()
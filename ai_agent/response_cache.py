@@ -0,0 +1,128 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(message: str) -> str:
+    """Lowercase a query and drop punctuation and repeated whitespace"""
+    message = PUNCTUATION_PATTERN.sub(" ", message.lower())
+    return WHITESPACE_PATTERN.sub(" ", message).strip()
+
+
+def fingerprint(
+    context: Union[str, Sequence[str]] = "",
+    history: Optional[Sequence[Dict[str, str]]] = None
+) -> str:
+    """Short stable hash of the retrieved context and conversation history"""
+    digest = hashlib.sha1()
+    blocks = [context] if isinstance(context, str) else context
+    for block in blocks:
+        digest.update(block.encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(b"\x01")
+    for msg in history or []:
+        digest.update(f"{msg['role']}:{msg['content']}".encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def context_fingerprint(context: Union[str, Sequence[str]] = "") -> str:
+    """Hash of which passages were retrieved, whatever order they ranked in.
+
+    Paraphrases of a question usually retrieve the same passages in a
+    different order; the answer still comes from the same knowledge, so they
+    share a fingerprint. Any change to a passage's text changes it.
+    """
+    blocks = [context] if isinstance(context, str) else context
+    return fingerprint(sorted(blocks))
+
+
+class ResponseCache:
+    """Bounded LRU cache of generated responses with per-entry TTL.
+
+    Bounded both by entry count and by the approximate bytes held in keys and
+    values; whichever limit is hit first evicts the least recently used entry.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 8 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()  # key -> (value, expires_at, size)
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(
+        message: str,
+        context: Union[str, Sequence[str]] = "",
+        history: Optional[Sequence[Dict[str, str]]] = None
+    ) -> str:
+        """Cache key from the normalized query plus a fingerprint of what produced the answer"""
+        return f"{normalize_query(message)}|{fingerprint(context, history)}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached value, or None on miss or expiry"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Store a value, evicting least recently used entries to stay within bounds"""
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl), size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, keeping the counters"""
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
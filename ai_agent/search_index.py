@@ -0,0 +1,138 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+ALNUM_PARTS_PATTERN = re.compile(r"[a-z]+|[0-9]+")
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for",
+    "from", "has", "have", "how", "i", "in", "is", "it", "its", "me", "my", "of", "on",
+    "or", "so", "that", "the", "their", "there", "this", "to", "was", "we", "what",
+    "when", "where", "which", "who", "will", "with", "you", "your",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms.
+
+    Mixed tokens such as model names ("f900r") also emit their letter and digit
+    parts so they match content written as "F 900 R".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalpha() and not token.isdigit():
+            tokens.extend(ALNUM_PARTS_PATTERN.findall(token))
+    return tokens
+
+
+class SearchIndex:
+    """In-memory inverted index with BM25 ranking"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.documents
+
+    def add_document(self, doc_id: str, text: str, document: Optional[Dict[str, Any]] = None):
+        """Index a document, replacing any previous version with the same ID"""
+        if doc_id in self.documents:
+            self.remove_document(doc_id)
+
+        term_counts = Counter(tokenize(text))
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+        length = sum(term_counts.values())
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = list(term_counts)
+        self.documents[doc_id] = document if document is not None else {"id": doc_id}
+        self._total_length += length
+
+    def remove_document(self, doc_id: str):
+        """Remove a document and its postings from the index"""
+        if doc_id not in self.documents:
+            return
+
+        for term in self.doc_terms.pop(doc_id):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+        self._total_length -= self.doc_lengths.pop(doc_id)
+        del self.documents[doc_id]
+
+    def clear(self):
+        """Remove every document from the index"""
+        self.postings.clear()
+        self.doc_lengths.clear()
+        self.doc_terms.clear()
+        self.documents.clear()
+        self._total_length = 0
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get the stored document for an ID"""
+        return self.documents.get(doc_id)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return the top_k (doc_id, score) pairs for a query, best first"""
+        if not self.documents or top_k <= 0:
+            return []
+
+        doc_count = len(self.documents)
+        avg_length = self._total_length / doc_count if doc_count else 0.0
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length) if avg_length else self.k1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def sync(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]) -> Dict[str, int]:
+        """Bring the index in line with a full document set, touching only what changed.
+
+        Takes (doc_id, text, document) triples and returns counts of added,
+        updated and removed documents.
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        seen = set()
+
+        for doc_id, text, document in documents:
+            seen.add(doc_id)
+            existing = self.documents.get(doc_id)
+            if existing is None:
+                self.add_document(doc_id, text, document)
+                stats["added"] += 1
+            elif existing is not document and existing != document:
+                self.add_document(doc_id, text, document)
+                stats["updated"] += 1
+            else:
+                self.documents[doc_id] = document
+
+        for doc_id in [doc_id for doc_id in self.documents if doc_id not in seen]:
+            self.remove_document(doc_id)
+            stats["removed"] += 1
+
+        return stats
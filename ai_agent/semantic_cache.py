@@ -0,0 +1,117 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Answer cache matched by embedding similarity instead of exact text.
+
+    Embeddings live in one preallocated, L2-normalized float32 matrix used as
+    a ring buffer, so a lookup is a single matrix-vector product. When full,
+    the oldest entry is overwritten. Each entry also records a fingerprint of
+    the passages it was generated from (see `context_fingerprint`), and only
+    entries with the caller's fingerprint can match, so answers go stale as
+    soon as the knowledge base changes.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[Sequence[float]]],
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        ttl: float = 3600.0,
+        retry_after: float = 60.0
+    ):
+        self.embed_fn = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.retry_after = retry_after
+
+        self._vectors: Optional[np.ndarray] = None  # allocated once the embedding size is known
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._contexts = np.zeros(max_entries, dtype=np.uint64)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._queries: List[Optional[str]] = [None] * max_entries
+        self._count = 0
+        self._next_slot = 0
+        self._disabled_until = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.embed_errors = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def embed(self, query: str) -> Optional[np.ndarray]:
+        """Embed and normalize a query, or None if the embedding backend is unavailable"""
+        if time.monotonic() < self._disabled_until:
+            return None
+        try:
+            vector = np.asarray(await self.embed_fn(normalize_query(query)), dtype=np.float32)
+        except Exception as e:
+            self.embed_errors += 1
+            self._disabled_until = time.monotonic() + self.retry_after
+            logger.warning(f"Semantic cache embedding failed, bypassing for {self.retry_after}s: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if not norm or (self._vectors is not None and vector.shape[0] != self._vectors.shape[1]):
+            return None
+        return vector / norm
+
+    @staticmethod
+    def _context_id(context: str) -> np.uint64:
+        """Pack a hex context fingerprint into the uint64 stored per entry"""
+        return np.uint64(int(context[:16], 16)) if context else np.uint64(0)
+
+    def search(self, vector: Optional[np.ndarray], context: str = "") -> Optional[Tuple[str, float]]:
+        """Return the closest live cached response for the same context and its similarity, if above threshold"""
+        if vector is None or not self._count:
+            self.misses += 1
+            return None
+        similarities = self._vectors[:self._count] @ vector
+        similarities[self._expires_at[:self._count] <= time.monotonic()] = -1.0
+        similarities[self._contexts[:self._count] != self._context_id(context)] = -1.0
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug(f"Semantic cache hit ({similarities[best]:.3f}) on cached query: {self._queries[best]}")
+        return self._responses[best], float(similarities[best])
+
+    def add(self, vector: Optional[np.ndarray], query: str, response: str, context: str = ""):
+        """Store a response under an already computed query embedding and the fingerprint of its context"""
+        if vector is None:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        slot = self._next_slot
+        self._vectors[slot] = vector
+        self._expires_at[slot] = time.monotonic() + self.ttl
+        self._contexts[slot] = self._context_id(context)
+        self._responses[slot] = response
+        self._queries[slot] = query
+        self._next_slot = (slot + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "embed_errors": self.embed_errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
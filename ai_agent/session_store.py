@@ -0,0 +1,225 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiosqlite
+
+Message = Dict[str, Any]
+
+
+class SessionStore(ABC):
+    """Where ChatManager keeps conversation history and user-to-session links.
+
+    Shared implementations let several worker processes serve the same
+    session. Each message is a dict with role, content and an ISO timestamp.
+    """
+
+    @abstractmethod
+    async def load_history(self, session_id: str) -> Optional[List[Message]]:
+        """Stored messages for a session, oldest first, or None if the session is unknown"""
+
+    @abstractmethod
+    async def append_messages(self, session_id: str, messages: List[Message], max_messages: int):
+        """Append messages and keep only the newest `max_messages`"""
+
+    @abstractmethod
+    async def delete_session(self, session_id: str):
+        """Forget a session's history and any user linked to it"""
+
+    @abstractmethod
+    async def set_user_session(self, user_id: str, session_id: str):
+        """Link a user to their current session"""
+
+    @abstractmethod
+    async def get_user_session(self, user_id: str) -> Optional[str]:
+        """Session currently linked to a user"""
+
+    @abstractmethod
+    async def expire_sessions(self, older_than: float, keep: Iterable[str] = ()) -> List[str]:
+        """Delete sessions last active before the `older_than` epoch time, except `keep`"""
+
+    @abstractmethod
+    async def counts(self) -> Dict[str, int]:
+        """Number of stored sessions and linked users"""
+
+    async def close(self):
+        """Release connections"""
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store, only correct with a single worker"""
+
+    def __init__(self):
+        self.histories: Dict[str, List[Message]] = {}
+        self.last_active: Dict[str, float] = {}
+        self.user_sessions: Dict[str, str] = {}  # user_id -> session_id
+
+    async def load_history(self, session_id: str) -> Optional[List[Message]]:
+        history = self.histories.get(session_id)
+        return list(history) if history is not None else None
+
+    async def append_messages(self, session_id: str, messages: List[Message], max_messages: int):
+        history = self.histories.setdefault(session_id, [])
+        history.extend(messages)
+        del history[:-max_messages]
+        self.last_active[session_id] = time.time()
+
+    async def delete_session(self, session_id: str):
+        self.histories.pop(session_id, None)
+        self.last_active.pop(session_id, None)
+        for user_id in [user for user, sid in self.user_sessions.items() if sid == session_id]:
+            del self.user_sessions[user_id]
+
+    async def set_user_session(self, user_id: str, session_id: str):
+        self.user_sessions[user_id] = session_id
+        self.histories.setdefault(session_id, [])
+        self.last_active[session_id] = time.time()
+
+    async def get_user_session(self, user_id: str) -> Optional[str]:
+        return self.user_sessions.get(user_id)
+
+    async def expire_sessions(self, older_than: float, keep: Iterable[str] = ()) -> List[str]:
+        keep = set(keep)
+        expired = [
+            session_id for session_id, active in self.last_active.items()
+            if active < older_than and session_id not in keep
+        ]
+        for session_id in expired:
+            await self.delete_session(session_id)
+        return expired
+
+    async def counts(self) -> Dict[str, int]:
+        return {"sessions": len(self.histories), "users": len(self.user_sessions)}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a SQLite file, shared by every worker on the same host"""
+
+    def __init__(self, db_path: str = "./ai_agent_sessions.db"):
+        self.db_path = db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _db(self) -> aiosqlite.Connection:
+        """Get the long-lived connection, creating the tables on first use"""
+        if self._conn is not None:
+            return self._conn
+        async with self._connect_lock:
+            if self._conn is None:
+                conn = await aiosqlite.connect(self.db_path)
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                # Other workers write the same file; wait for their locks instead of failing
+                await conn.execute("PRAGMA busy_timeout=5000")
+                await conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS chat_sessions (
+                        session_id TEXT PRIMARY KEY,
+                        last_active REAL NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS chat_messages (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        role TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        timestamp TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id);
+                    CREATE INDEX IF NOT EXISTS idx_chat_sessions_active ON chat_sessions (last_active);
+                    CREATE TABLE IF NOT EXISTS chat_user_sessions (
+                        user_id TEXT PRIMARY KEY,
+                        session_id TEXT NOT NULL
+                    );
+                """)
+                await conn.commit()
+                self._conn = conn
+        return self._conn
+
+    async def load_history(self, session_id: str) -> Optional[List[Message]]:
+        db = await self._db()
+        async with db.execute("SELECT 1 FROM chat_sessions WHERE session_id = ?", (session_id,)) as cursor:
+            if await cursor.fetchone() is None:
+                return None
+        async with db.execute(
+            "SELECT role, content, timestamp FROM chat_messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [{"role": role, "content": content, "timestamp": timestamp} for role, content, timestamp in rows]
+
+    async def append_messages(self, session_id: str, messages: List[Message], max_messages: int):
+        db = await self._db()
+        await db.execute("""
+            INSERT INTO chat_sessions (session_id, last_active) VALUES (?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET last_active = excluded.last_active
+        """, (session_id, time.time()))
+        await db.executemany(
+            "INSERT INTO chat_messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [(session_id, m["role"], m["content"], m["timestamp"]) for m in messages]
+        )
+        await db.execute("""
+            DELETE FROM chat_messages WHERE session_id = ? AND id NOT IN (
+                SELECT id FROM chat_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?
+            )
+        """, (session_id, session_id, max_messages))
+        await db.commit()
+
+    async def delete_session(self, session_id: str):
+        db = await self._db()
+        await db.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM chat_user_sessions WHERE session_id = ?", (session_id,))
+        await db.commit()
+
+    async def set_user_session(self, user_id: str, session_id: str):
+        db = await self._db()
+        await db.execute("""
+            INSERT INTO chat_sessions (session_id, last_active) VALUES (?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET last_active = excluded.last_active
+        """, (session_id, time.time()))
+        await db.execute("""
+            INSERT INTO chat_user_sessions (user_id, session_id) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET session_id = excluded.session_id
+        """, (user_id, session_id))
+        await db.commit()
+
+    async def get_user_session(self, user_id: str) -> Optional[str]:
+        db = await self._db()
+        async with db.execute("SELECT session_id FROM chat_user_sessions WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def expire_sessions(self, older_than: float, keep: Iterable[str] = ()) -> List[str]:
+        db = await self._db()
+        keep = set(keep)
+        async with db.execute("SELECT session_id FROM chat_sessions WHERE last_active < ?", (older_than,)) as cursor:
+            expired = [row[0] for row in await cursor.fetchall() if row[0] not in keep]
+        for session_id in expired:
+            await self.delete_session(session_id)
+        return expired
+
+    async def counts(self) -> Dict[str, int]:
+        db = await self._db()
+        async with db.execute("""
+            SELECT (SELECT COUNT(*) FROM chat_sessions), (SELECT COUNT(*) FROM chat_user_sessions)
+        """) as cursor:
+            sessions, users = await cursor.fetchone()
+        return {"sessions": sessions, "users": users}
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+def create_session_store(backend: str = "memory", url: Optional[str] = None) -> SessionStore:
+    """Build the configured session store: memory, sqlite (url is a file path) or redis (url is a redis:// URL)"""
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(url or "./ai_agent_sessions.db")
+    if backend == "redis":
+        # Imported here so redis is only needed by deployments that use it
+        from redis_session_store import RedisSessionStore
+        return RedisSessionStore(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown session store: {backend}")
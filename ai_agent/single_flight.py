@@ -0,0 +1,129 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SharedStream:
+    """Chunks of one streamed run, replayable from the start by every caller that joins it"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._wakeup = asyncio.Event()
+
+    def push(self, chunk: str):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def replay(self) -> AsyncIterator[str]:
+        """Yield every chunk so far, then new ones as they arrive, until the run finishes"""
+        position = 0
+        while True:
+            # Taken before draining, so a chunk pushed while we yield still wakes us
+            wakeup = self._wakeup
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await wakeup.wait()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await the same task. The task is shielded, so a
+    caller that disconnects does not cancel the work for everyone else.
+    Streamed runs also keep their chunks, so later callers replay the stream
+    instead of waiting for the final result.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, SharedStream] = {}  # key -> chunks of a streamed run in _in_flight
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn for key, or join the run already in progress"""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, produce: Callable[[SharedStream], Awaitable[T]]) -> SharedStream:
+        """Start a streamed run for key, or return the one in progress so its chunks can be replayed.
+
+        `produce` pushes chunks to the stream it is given; its return value is
+        what `do` and `join` callers for the same key receive.
+        """
+        shared = self._streams.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            return shared
+
+        shared = SharedStream()
+
+        async def run():
+            try:
+                result = await produce(shared)
+            except BaseException as e:
+                shared.finish(e)
+                raise
+            shared.finish()
+            return result
+
+        task = asyncio.ensure_future(run())
+        self._in_flight[key] = task
+        self._streams[key] = shared
+        task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        self.executions += 1
+        return shared
+
+    def streaming(self, key: str) -> bool:
+        """True if a streamed run for key is in progress"""
+        return key in self._streams
+
+    def join(self, key: str) -> Optional[Awaitable[Any]]:
+        """Awaitable for the run already in progress for key, or None if there is none"""
+        task = self._in_flight.get(key)
+        if task is None:
+            return None
+        self.coalesced += 1
+        return asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Execution and coalescing counters"""
+        requests = self.executions + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+        }
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._streams.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved so orphaned failures don't warn at shutdown
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import math
+from typing import Dict, List, Optional, Tuple
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Approximate distinct counter in a fixed 2**precision bytes.
+
+    With the default precision of 12 the sketch is 4 KB and the standard
+    error is about 1.6%. Sketches of the same precision merge by taking the
+    register-wise maximum, so per-day sketches can be combined into any
+    window.
+    """
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError(f"Expected {self.size} registers, got {len(self.registers)}")
+
+    def add(self, value: str):
+        """Record one value"""
+        x = _hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        # Position of the first set bit in the remaining bits, 1-based
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are still empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = 12) -> "HyperLogLog":
+        return cls(precision, data) if data else cls(precision)
+
+
+class SpaceSaving:
+    """Heavy-hitters sketch tracking the most frequent items in bounded memory.
+
+    Keeps at most `capacity` counters. An unseen item replaces the smallest
+    counter and inherits its count as an error bound, so any item whose true
+    frequency exceeds total/capacity is guaranteed to be present.
+    """
+
+    def __init__(self, capacity: int = 200, counters: Optional[Dict[str, List[int]]] = None):
+        self.capacity = capacity
+        # item -> [count, overestimation bound]
+        self.counters: Dict[str, List[int]] = counters or {}
+
+    def offer(self, item: str, count: int = 1):
+        """Record `count` occurrences of item"""
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            return
+        victim = min(self.counters, key=lambda key: self.counters[key][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[item] = [floor + count, floor]
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Most frequent items with their estimated counts, highest first"""
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [(item, counter[0]) for item, counter in ranked[:limit]]
+
+    def to_json(self) -> str:
+        return json.dumps({"capacity": self.capacity, "counters": self.counters})
+
+    @classmethod
+    def from_json(cls, data: Optional[str], capacity: int = 200) -> "SpaceSaving":
+        if not data:
+            return cls(capacity)
+        state = json.loads(data)
+        return cls(state["capacity"], state["counters"])
@@ -0,0 +1,445 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import aiosqlite
+
+from storage import (
+    ALL_TIME_BUCKET,
+    TABLE_COLUMNS,
+    RollupDelta,
+    Rows,
+    StorageBackend,
+    count_distinct_users,
+    top_queries,
+)
+
+logger = logging.getLogger(__name__)
+
+INSERT_STATEMENTS = {
+    table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+
+async def apply_rollups(db: aiosqlite.Connection, delta: RollupDelta):
+    """Fold a rollup delta into the rollup tables, inside the caller's transaction"""
+    if delta.conversation_counts:
+        await db.executemany("""
+            INSERT INTO rollup_hourly_conversations (hour, conversations) VALUES (?, ?)
+            ON CONFLICT (hour) DO UPDATE SET conversations = conversations + excluded.conversations
+        """, list(delta.conversation_counts.items()))
+    if delta.event_counts:
+        await db.executemany("""
+            INSERT INTO rollup_hourly_events (hour, event_type, count) VALUES (?, ?, ?)
+            ON CONFLICT (hour, event_type) DO UPDATE SET count = count + excluded.count
+        """, [(hour, event_type, count) for (hour, event_type), count in delta.event_counts.items()])
+        
+    # Sketches are read, merged and written back; the batched writer is the only writer
+    for bucket in delta.sketch_rows:
+        async with db.execute(
+            "SELECT users_hll, top_queries FROM rollup_sketches WHERE bucket = ?", (bucket,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        users_hll, queries = delta.merge_sketches(bucket, row[0] if row else None, row[1] if row else None)
+        await db.execute("""
+            INSERT INTO rollup_sketches (bucket, users_hll, top_queries) VALUES (?, ?, ?)
+            ON CONFLICT (bucket) DO UPDATE SET users_hll = excluded.users_hll, top_queries = excluded.top_queries
+        """, (bucket, users_hll, queries))
+
+
+async def _backfill_rollups(db: aiosqlite.Connection, chunk_size: int = 1000):
+    """Build the rollups from rows written before they existed"""
+    async with db.execute("SELECT created_at, user_id, user_message FROM conversations ORDER BY id") as cursor:
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            await apply_rollups(db, RollupDelta([
+                (datetime.fromisoformat(row[0]), row[1], row[2]) for row in rows
+            ], []))
+    async with db.execute("SELECT created_at, event_type FROM analytics ORDER BY id") as cursor:
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            await apply_rollups(db, RollupDelta([], [(datetime.fromisoformat(row[0]), row[1]) for row in rows]))
+
+
+MigrationStep = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+# Schema history, applied in order by SQLiteStorage._migrate. Never edit a
+# released migration; append a new one instead. Steps are SQL statements or
+# coroutines taking the connection. Version 1 uses IF NOT EXISTS so databases
+# created before migrations existed are adopted as-is.
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            user_id TEXT,
+            user_message TEXT NOT NULL,
+            ai_response TEXT NOT NULL,
+            sources TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            session_id TEXT,
+            user_id TEXT,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS knowledge_base_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT NOT NULL,
+            document_url TEXT,
+            document_title TEXT,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "time and session indexes", [
+        # History lookups filter on session and sort by time
+        "CREATE INDEX IF NOT EXISTS idx_conversations_session_created ON conversations (session_id, created_at)",
+        # Range scans for summaries and retention; user_id makes the distinct-users count index-only
+        "CREATE INDEX IF NOT EXISTS idx_conversations_created_user ON conversations (created_at, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_created ON analytics (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_event_created ON analytics (event_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_base_logs_created ON knowledge_base_logs (created_at)",
+    ]),
+    (3, "full-text search over conversations", [
+        # External-content FTS5 table: the text lives only in conversations, triggers keep the index in step
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            user_message,
+            ai_response,
+            content='conversations',
+            content_rowid='id',
+            tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, user_message, ai_response)
+            VALUES (new.id, new.user_message, new.ai_response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, user_message, ai_response)
+            VALUES ('delete', old.id, old.user_message, old.ai_response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, user_message, ai_response)
+            VALUES ('delete', old.id, old.user_message, old.ai_response);
+            INSERT INTO conversations_fts (rowid, user_message, ai_response)
+            VALUES (new.id, new.user_message, new.ai_response);
+        END
+        """,
+        # Backfill rows logged before the index existed
+        "INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')",
+    ]),
+    (4, "analytics rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS rollup_hourly_conversations (
+            hour TEXT PRIMARY KEY,
+            conversations INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_hourly_events (
+            hour TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, event_type)
+        )
+        """,
+        # One row per UTC day plus an all-time row: distinct-user and top-query sketches
+        """
+        CREATE TABLE IF NOT EXISTS rollup_sketches (
+            bucket TEXT PRIMARY KEY,
+            users_hll BLOB,
+            top_queries TEXT
+        )
+        """,
+        _backfill_rollups,
+    ]),
+]
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class SQLiteStorage(StorageBackend):
+    """Single-file SQLite storage over one long-lived WAL-mode connection"""
+
+    def __init__(self, db_path: str = "./ai_agent.db", backup_pages_per_step: int = 256, backup_step_pause: float = 0.01):
+        self.db_path = db_path
+        self.backup_pages_per_step = backup_pages_per_step
+        self.backup_step_pause = backup_step_pause
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        # The connection is shared, so each write transaction holds this to keep others out of it
+        self._transaction_lock = asyncio.Lock()
+    
+    async def _db(self) -> aiosqlite.Connection:
+        """Get the long-lived connection, opening it on first use"""
+        if self._conn is not None:
+            return self._conn
+        async with self._connect_lock:
+            if self._conn is None:
+                conn = await aiosqlite.connect(self.db_path)
+                # WAL lets reads run alongside the batched writer; NORMAL sync is durable enough under WAL
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                conn.row_factory = aiosqlite.Row
+                self._conn = conn
+        return self._conn
+    
+    async def initialize(self):
+        await self._migrate(await self._db())
+    
+    async def _migrate(self, db: aiosqlite.Connection):
+        """Apply every migration newer than the database's recorded schema version"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.commit()
+        current = await self.schema_version()
+        
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            # Each migration is applied atomically together with its version record. IMMEDIATE takes
+            # the write lock up front, so a second worker starting on the same file waits here and
+            # then sees the migration as applied, instead of both reading the old version
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                current = await self.schema_version()
+                if version <= current:
+                    await db.commit()
+                    continue
+                for step in statements:
+                    if callable(step):
+                        await step(db)
+                    else:
+                        await db.execute(step)
+                await db.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                logger.error(f"Migration {version} ({description}) failed")
+                raise
+            logger.info(f"Applied database migration {version}: {description}")
+    
+    async def schema_version(self) -> int:
+        db = await self._db()
+        async with db.execute("SELECT MAX(version) AS version FROM schema_migrations") as cursor:
+            row = await cursor.fetchone()
+        return row["version"] or 0
+    
+    async def write_batch(self, rows_by_table: Dict[str, Rows], written_at: datetime):
+        """Insert with one executemany per table, committing the rows and their rollups together"""
+        db = await self._db()
+        async with self._transaction_lock:
+            try:
+                for table, rows in rows_by_table.items():
+                    await db.executemany(INSERT_STATEMENTS[table], rows)
+                await apply_rollups(db, RollupDelta.from_batch(rows_by_table, written_at))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+    
+    async def get_conversation_history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        db = await self._db()
+        
+        async with db.execute("""
+            SELECT * FROM conversations
+            WHERE session_id = ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (session_id, limit)) as cursor:
+            rows = await cursor.fetchall()
+            
+        return [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "user_id": row["user_id"],
+                "user_message": row["user_message"],
+                "ai_response": row["ai_response"],
+                "sources": json.loads(row["sources"]) if row["sources"] else [],
+                "created_at": row["created_at"]
+            }
+            for row in rows
+        ]
+    
+    async def get_analytics_summary(self, days: int) -> Dict[str, Any]:
+        db = await self._db()
+        since = f"-{days} days"
+        
+        # Get total conversations
+        async with db.execute("""
+            SELECT COALESCE(SUM(conversations), 0) as count FROM rollup_hourly_conversations
+            WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', ?)
+        """, (since,)) as cursor:
+            total_conversations = (await cursor.fetchone())["count"]
+            
+        # Get unique users by merging the daily sketches in the window
+        async with db.execute("""
+            SELECT users_hll FROM rollup_sketches
+            WHERE bucket != ? AND bucket >= date('now', ?)
+        """, (ALL_TIME_BUCKET, since)) as cursor:
+            sketches = await cursor.fetchall()
+        unique_users = count_distinct_users([row["users_hll"] for row in sketches])
+        
+        # Get event counts
+        async with db.execute("""
+            SELECT event_type, SUM(count) as count FROM rollup_hourly_events
+            WHERE hour >= strftime('%Y-%m-%d %H:00:00', 'now', ?)
+            GROUP BY event_type
+        """, (since,)) as cursor:
+            events = await cursor.fetchall()
+        event_counts = {row["event_type"]: row["count"] for row in events}
+        
+        return {
+            "period_days": days,
+            "total_conversations": total_conversations,
+            "unique_users": unique_users,
+            "event_counts": event_counts
+        }
+    
+    async def get_popular_queries(self, limit: int) -> List[Dict[str, Any]]:
+        db = await self._db()
+        async with db.execute(
+            "SELECT top_queries FROM rollup_sketches WHERE bucket = ?", (ALL_TIME_BUCKET,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return top_queries(row["top_queries"] if row else None, limit)
+    
+    async def search_conversations(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        match = fts_query(query)
+        if not match:
+            return []
+        db = await self._db()
+        
+        try:
+            async with db.execute("""
+                SELECT c.id, c.session_id, c.user_id, c.user_message, c.ai_response, c.created_at,
+                       snippet(conversations_fts, -1, '[', ']', '...', 16) AS snippet,
+                       bm25(conversations_fts) AS score
+                FROM conversations_fts
+                JOIN conversations c ON c.id = conversations_fts.rowid
+                WHERE conversations_fts MATCH ?
+                ORDER BY score
+                LIMIT ?
+            """, (match, limit)) as cursor:
+                rows = await cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            # Keep search working if the FTS index is unusable, just without ranking
+            logger.warning(f"Full-text search unavailable, falling back to LIKE: {e}")
+            return await self._search_conversations_like(query, limit)
+            
+        return [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "user_id": row["user_id"],
+                "user_message": row["user_message"],
+                "ai_response": row["ai_response"],
+                "created_at": row["created_at"],
+                "snippet": row["snippet"],
+                # bm25() is lower-is-better; flip it so callers see higher-is-better
+                "score": -row["score"]
+            }
+            for row in rows
+        ]
+    
+    async def _search_conversations_like(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Unindexed substring search, used only when FTS5 is missing"""
+        db = await self._db()
+        async with db.execute("""
+            SELECT * FROM conversations
+            WHERE user_message LIKE ? OR ai_response LIKE ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (f"%{query}%", f"%{query}%", limit)) as cursor:
+            rows = await cursor.fetchall()
+        return [
+            {
+                "id": row["id"],
+                "session_id": row["session_id"],
+                "user_id": row["user_id"],
+                "user_message": row["user_message"],
+                "ai_response": row["ai_response"],
+                "created_at": row["created_at"],
+                "snippet": None,
+                "score": None
+            }
+            for row in rows
+        ]
+    
+    async def delete_expired(self, table: str, days: int, limit: int) -> int:
+        db = await self._db()
+        async with self._transaction_lock:
+            cursor = await db.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE created_at < datetime('now', ?)
+                    LIMIT ?
+                )
+            """, (f"-{days} days", limit))
+            await db.commit()
+        return cursor.rowcount
+    
+    async def backup(self, backup_path: str):
+        """Copy the live database with SQLite's online backup API, off the event loop"""
+        await asyncio.to_thread(self._backup_to, backup_path)
+    
+    def _backup_to(self, backup_path: str):
+        """Run the page-stepped backup on its own connections"""
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(backup_path)
+        try:
+            # Holding a read transaction pins one WAL snapshot: the copy is consistent and the
+            # step loop is not restarted by every commit, while writers carry on unblocked
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=self.backup_pages_per_step, sleep=self.backup_step_pause)
+            source.rollback()
+        finally:
+            target.close()
+            source.close()
+    
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
@@ -14,9 +14,10 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from main import app
+from config import settings
 from ollama_client import OllamaClient
 from website_scraper import WebsiteScraper
-from database import DatabaseManager
+from database import DatabaseManager, create_storage
 import uvicorn
 
 # Configure logging
@@ -53,14 +54,26 @@ async def check_ollama():
 
 async def initialize_database():
     """Initialize the database"""
+    # The same database main.py uses, SQLite file or PostgreSQL
+    db_manager = DatabaseManager(storage=create_storage(
+        settings.database_url,
+        settings.database_path,
+        backup_pages_per_step=settings.backup_pages_per_step,
+        backup_step_pause=settings.backup_step_pause,
+        min_pool_size=settings.postgres_min_pool_size,
+        max_pool_size=settings.postgres_max_pool_size
+    ))
     try:
-        db_manager = DatabaseManager()
-        await db_manager.initialize()
+        # Only migrates the schema; the app opens its own manager with the background writer
+        await db_manager.initialize(start_writer=False)
         logger.info("✅ Database initialized successfully")
         return True
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {e}")
         return False
+    finally:
+        # The connection's thread is not a daemon and would keep the process alive
+        await db_manager.close()
 
 
 
@@ -0,0 +1,144 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from response_cache import normalize_query
+from sketches import HyperLogLog, SpaceSaving
+
+# Columns written for each logged table, in the order DatabaseManager builds rows
+TABLE_COLUMNS = {
+    "conversations": ("session_id", "user_id", "user_message", "ai_response", "sources"),
+    "analytics": ("event_type", "session_id", "user_id", "data"),
+    "knowledge_base_logs": ("action", "document_url", "document_title", "status"),
+}
+
+# Tables trimmed by DatabaseManager.cleanup_old_data
+RETENTION_TABLES = ("conversations", "analytics", "knowledge_base_logs")
+
+# Distinct users are counted with HyperLogLog registers of this precision (4 KB, ~1.6% error)
+ROLLUP_HLL_PRECISION = 12
+# Number of normalized queries the heavy-hitters sketch keeps counters for
+ROLLUP_TOP_QUERIES_CAPACITY = 200
+# Sketch bucket accumulating everything since the rollups were created
+ALL_TIME_BUCKET = "all"
+
+Rows = List[Tuple[Any, ...]]
+
+
+class RollupDelta:
+    """What a set of newly written rows adds to the rollup tables.
+
+    `conversations` holds (created_at, user_id, user_message) and `events`
+    holds (created_at, event_type), with UTC timestamps.
+    """
+
+    def __init__(
+        self,
+        conversations: List[Tuple[datetime, Optional[str], str]],
+        events: List[Tuple[datetime, str]]
+    ):
+        self.conversation_counts: Counter = Counter()
+        self.event_counts: Counter = Counter()
+        # bucket -> (user ids, normalized queries) to fold into that bucket's sketches
+        self.sketch_rows: Dict[str, Tuple[List[str], List[str]]] = {}
+
+        for created_at, user_id, user_message in conversations:
+            self.conversation_counts[created_at.strftime("%Y-%m-%d %H:00:00")] += 1
+            query = normalize_query(user_message)
+            for bucket in (created_at.strftime("%Y-%m-%d"), ALL_TIME_BUCKET):
+                users, queries = self.sketch_rows.setdefault(bucket, ([], []))
+                if user_id:
+                    users.append(user_id)
+                if query:
+                    queries.append(query)
+
+        for created_at, event_type in events:
+            self.event_counts[(created_at.strftime("%Y-%m-%d %H:00:00"), event_type)] += 1
+
+    @classmethod
+    def from_batch(cls, rows_by_table: Dict[str, Rows], written_at: datetime) -> "RollupDelta":
+        """Delta for a batch of rows in TABLE_COLUMNS order, all stamped `written_at`"""
+        return cls(
+            [(written_at, row[1], row[2]) for row in rows_by_table.get("conversations", [])],
+            [(written_at, row[0]) for row in rows_by_table.get("analytics", [])]
+        )
+
+    def merge_sketches(
+        self,
+        bucket: str,
+        users_hll: Optional[bytes],
+        top_queries: Optional[str]
+    ) -> Tuple[bytes, str]:
+        """Fold this delta into a bucket's stored sketches, returning the new stored values"""
+        users, queries = self.sketch_rows[bucket]
+        hll = HyperLogLog.from_bytes(users_hll, ROLLUP_HLL_PRECISION)
+        top = SpaceSaving.from_json(top_queries, ROLLUP_TOP_QUERIES_CAPACITY)
+        for user_id in users:
+            hll.add(user_id)
+        for query in queries:
+            top.offer(query)
+        return hll.to_bytes(), top.to_json()
+
+
+def count_distinct_users(sketches: List[Optional[bytes]]) -> int:
+    """Merge per-day user sketches and estimate the distinct users across them"""
+    users = HyperLogLog(ROLLUP_HLL_PRECISION)
+    for data in sketches:
+        users.merge(HyperLogLog.from_bytes(data, ROLLUP_HLL_PRECISION))
+    return users.count()
+
+
+def top_queries(data: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """Popular queries from a stored heavy-hitters sketch"""
+    sketch = SpaceSaving.from_json(data, ROLLUP_TOP_QUERIES_CAPACITY)
+    return [{"query": query, "count": count} for query, count in sketch.top(limit)]
+
+
+class StorageBackend(ABC):
+    """Where DatabaseManager keeps its data.
+
+    Backends own the schema, the SQL dialect and their connections.
+    DatabaseManager owns batching, retention scheduling and error handling, so
+    backend methods raise on failure.
+    """
+
+    @abstractmethod
+    async def initialize(self):
+        """Connect and bring the schema up to the latest version"""
+
+    @abstractmethod
+    async def schema_version(self) -> int:
+        """Latest migration applied, 0 if none"""
+
+    @abstractmethod
+    async def write_batch(self, rows_by_table: Dict[str, Rows], written_at: datetime):
+        """Insert rows (in TABLE_COLUMNS order) and update the rollups in one transaction"""
+
+    @abstractmethod
+    async def get_conversation_history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Most recent exchanges for a session, newest first"""
+
+    @abstractmethod
+    async def get_analytics_summary(self, days: int) -> Dict[str, Any]:
+        """Conversation, distinct user and event counts over the last `days` days"""
+
+    @abstractmethod
+    async def get_popular_queries(self, limit: int) -> List[Dict[str, Any]]:
+        """Most frequent normalized queries with approximate counts"""
+
+    @abstractmethod
+    async def search_conversations(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Ranked full-text search with snippets"""
+
+    @abstractmethod
+    async def delete_expired(self, table: str, days: int, limit: int) -> int:
+        """Delete up to `limit` rows older than `days` from table, returning how many went"""
+
+    @abstractmethod
+    async def backup(self, backup_path: str):
+        """Write a consistent copy of the data to backup_path"""
+
+    @abstractmethod
+    async def close(self):
+        """Release connections"""
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The agent's modules import each other by bare name, as when run from ai_agent/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
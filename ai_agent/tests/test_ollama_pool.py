@@ -0,0 +1,165 @@
+import asyncio
+import http.server
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+
+from health_monitor import CLOSED, OPEN
+from ollama_pool import OllamaBackendPool
+
+MODEL = "llama3.2:1b"
+
+
+class StubOllama:
+    """Minimal Ollama HTTP API on a local port that can be told to fail"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.status = 200
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.respond(self, {"models": [{"name": MODEL}]})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append(self.path)
+                time.sleep(stub.delay)
+                if self.path == "/api/embeddings":
+                    stub.respond(self, {"embedding": [0.1, 0.2, 0.3]})
+                else:
+                    stub.respond(self, {"message": {"role": "assistant", "content": f"from {stub.url}"}, "done": True})
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, handler, payload):
+        body = json.dumps(payload if self.status == 200 else {"error": "model crashed"}).encode()
+        handler.send_response(self.status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    servers = [StubOllama(), StubOllama()]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+def refused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def make_pool(urls, **health_options) -> OllamaBackendPool:
+    return OllamaBackendPool(
+        base_urls=urls,
+        model_name=MODEL,
+        timeout=httpx.Timeout(5.0),
+        limits=httpx.Limits(max_connections=10),
+        max_attempts=2,
+        health_options={"failure_threshold": 3, "recovery_timeout": 30.0, **health_options}
+    )
+
+
+def chat(pool):
+    return pool.chat(model=MODEL, messages=[{"role": "user", "content": "hi"}])
+
+
+def test_concurrent_requests_go_to_least_outstanding_backend(stubs):
+    for stub in stubs:
+        stub.delay = 0.2  # keep requests outstanding while the others are routed
+
+    async def run():
+        pool = make_pool([stub.url for stub in stubs])
+        try:
+            await pool.check_now()
+            return await asyncio.gather(*(chat(pool) for _ in range(4)))
+        finally:
+            await pool.close()
+
+    responses = asyncio.run(run())
+
+    assert sorted(response["message"]["content"] for response in responses) == sorted(
+        [f"from {stubs[0].url}"] * 2 + [f"from {stubs[1].url}"] * 2
+    )
+
+
+def test_fails_over_on_server_error_and_refused_connection(stubs):
+    async def run():
+        failing = make_pool([stubs[0].url, stubs[1].url])
+        refused = make_pool([refused_url(), stubs[1].url])
+        try:
+            await failing.check_now()
+            await refused.check_now()
+            refused.backends[0].health.record_success()  # it was up when last probed
+            stubs[0].status = 500
+            answer = await chat(failing)
+            embedding = await refused.embeddings(model="nomic-embed-text", prompt="hi")
+            return failing, refused, answer, embedding
+        finally:
+            await failing.close()
+            await refused.close()
+
+    failing, refused, answer, embedding = asyncio.run(run())
+
+    assert answer["message"]["content"] == f"from {stubs[1].url}"
+    assert failing.retries == 1 and failing.backends[0].failures == 1
+    assert embedding["embedding"] == [0.1, 0.2, 0.3]
+    assert refused.retries == 1 and refused.backends[0].failures == 1
+    assert all(backend.outstanding == 0 for backend in failing.backends + refused.backends)
+
+
+def test_circuit_opens_reopens_and_closes_again(stubs):
+    broken, healthy = stubs
+
+    async def run():
+        pool = make_pool([broken.url, healthy.url], failure_threshold=1, recovery_timeout=0.2)
+        backend = pool.backends[0]
+        states = []
+        try:
+            await pool.check_now()
+            broken.status = 500
+            await chat(pool)
+            states.append(backend.health.state)
+            # While open, traffic skips the broken backend without retrying it
+            before = len(broken.requests)
+            await chat(pool)
+            states.append(len(broken.requests) - before)
+
+            # Half-open after the recovery timeout; a failed probe opens the circuit again
+            await asyncio.sleep(0.25)
+            assert not backend.health.is_available
+            await backend.health.check_now()
+            states.append(backend.health.state)
+
+            # Once the backend recovers, the next probe after the timeout closes it
+            broken.status = 200
+            await asyncio.sleep(0.25)
+            await backend.health.check_now()
+            states.append(backend.health.state)
+            states.append(pool.pick() is backend)
+            return states
+        finally:
+            await pool.close()
+
+    assert asyncio.run(run()) == [OPEN, 0, OPEN, CLOSED, True]
@@ -0,0 +1,138 @@
+import http.server
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from product_ingestion import ProductFeed, run_sync
+from website_scraper import WebsiteScraper
+
+BIKES = [
+    {"id": i, "brand": "Ducati", "name": f"Ducati Model {i}", "price": 20000 + i, "description": f"{150 + i} hp"}
+    for i in range(1, 6)
+]
+
+
+class StubCatalogue:
+    """Backend stand-in serving /api/bikes/all as Spring Data pages, with ETags"""
+
+    def __init__(self, bikes):
+        self.bikes = bikes
+        self.etag = '"v1"'
+        self.fail = False
+        self.requests = []  # (page, If-None-Match) per request
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                page, size = int(query.get("page", ["0"])[0]), int(query.get("size", ["100"])[0])
+                stub.requests.append((page, self.headers.get("If-None-Match")))
+                if stub.fail:
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == stub.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                total_pages = max(1, -(-len(stub.bikes) // size))
+                body = json.dumps({
+                    "content": stub.bikes[page * size:(page + 1) * size],
+                    "totalPages": total_pages,
+                    "size": size,
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", stub.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def catalogue():
+    stub = StubCatalogue(list(BIKES))
+    yield stub
+    stub.close()
+
+
+def make_scraper(tmp_path, catalogue, monkeypatch) -> WebsiteScraper:
+    """Scraper reading products from the stub, with page rendering faked out"""
+    rendered = []
+
+    def render(self, urls, skipped=0):
+        rendered.extend(urls)
+        return {url: {"url": url, "title": "Big Bike Blitz", "content": f"Rendered {url}"} for url in urls}
+
+    monkeypatch.setattr(WebsiteScraper, "_render", render)
+    monkeypatch.setattr(WebsiteScraper, "check_validators", lambda self, url: (False, {}))
+    monkeypatch.setattr(WebsiteScraper, "get_content_urls", lambda self: [f"{self.base_url}/about"])
+    scraper = WebsiteScraper(
+        base_url="http://shop.test",
+        api_base_url=catalogue.url,
+        products_from_api=True,
+        data_file=str(tmp_path / "scraped.json"),
+        state_file=str(tmp_path / "state.json"),
+        journal_file=str(tmp_path / "journal.jsonl"),
+    )
+    scraper.product_feed.page_size = 2
+    scraper.rendered = rendered
+    return scraper
+
+
+def test_feed_fetches_every_page(catalogue):
+    feed = ProductFeed(f"{catalogue.url}/api/bikes/all", "http://shop.test", page_size=2)
+
+    documents = run_sync(feed.fetch())
+
+    assert [document["metadata"]["bike_id"] for document in documents] == [1, 2, 3, 4, 5]
+    assert documents[0]["url"] == "http://shop.test/product/1"
+    assert "Horsepower: 151 hp" in documents[0]["content"]
+    assert sorted(page for page, _ in catalogue.requests) == [0, 1, 2]
+    assert feed.validators["etag"] == '"v1"'
+
+
+def test_unchanged_catalogue_reuses_documents(tmp_path, catalogue, monkeypatch):
+    scraper = make_scraper(tmp_path, catalogue, monkeypatch)
+    scraper.scrape_urls()
+    first = {entry["url"]: entry for entry in scraper.scraped_data}
+    catalogue.requests.clear()
+
+    journal = scraper.scrape_urls()
+
+    # One conditional request, answered 304; no further pages fetched
+    assert catalogue.requests == [(0, '"v1"')]
+    assert not journal
+    products = [entry for entry in scraper.scraped_data if entry.get("metadata", {}).get("source") == "api"]
+    assert len(products) == 5
+    assert all(entry is first[entry["url"]] for entry in products)
+    # Products came from the API, so no product page was ever rendered
+    assert scraper.rendered == ["http://shop.test/about"]
+
+
+def test_api_error_falls_back_and_keeps_products(tmp_path, catalogue, monkeypatch):
+    scraper = make_scraper(tmp_path, catalogue, monkeypatch)
+    scraper.scrape_urls()
+    catalogue.fail = True
+
+    assert scraper.ingest_products() is None
+    journal = scraper.scrape_urls()
+
+    # Product pages can't be listed either, so the last known products stay
+    assert journal.removed == []
+    assert len([entry for entry in scraper.scraped_data if entry.get("metadata", {}).get("source") == "api"]) == 5
+    assert scraper.search("Ducati Model 3")[0]["url"] == "http://shop.test/product/3"
@@ -0,0 +1,66 @@
+import asyncio
+
+from ollama_client import OllamaClient
+
+PASSAGES = [
+    "BMW F900R\nPrice: $9,995. Inline twin, 105 hp.",
+    "Financing\nRates from 3.9% APR on every model.",
+    "BMW F900XR\nPrice: $12,495. Touring version of the F900R.",
+]
+
+# Both paraphrases embed close together, the unrelated question points elsewhere
+EMBEDDINGS = {
+    "how much is the f900r": [1.0, 0.02, 0.0],
+    "f900r price": [0.99, 0.03, 0.0],
+    "do you deliver": [0.0, 0.0, 1.0],
+}
+
+
+def make_client(monkeypatch):
+    client = OllamaClient()
+    calls = []
+
+    async def embeddings(model, prompt):
+        return {"embedding": EMBEDDINGS[prompt]}
+
+    async def chat(model, messages, options):
+        calls.append(messages[-1]["content"])
+        return {"message": {"content": f"answer {len(calls)}"}}
+
+    async def is_available():
+        return True
+
+    monkeypatch.setattr(client.pool, "embeddings", embeddings)
+    monkeypatch.setattr(client.pool, "chat", chat)
+    monkeypatch.setattr(client, "is_available", is_available)
+    return client, calls
+
+
+def test_paraphrases_retrieving_the_same_passages_share_an_answer(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    async def ask():
+        first = await client.generate_response("How much is the F900R", context=PASSAGES)
+        # Same passages, ranked differently for the paraphrase
+        second = await client.generate_response("F900R price?", context=[PASSAGES[2], PASSAGES[0], PASSAGES[1]])
+        return first, second
+
+    first, second = asyncio.run(ask())
+
+    assert first == second == "answer 1"
+    assert len(calls) == 1
+    assert client.semantic_cache.hits == 1
+
+
+def test_paraphrase_with_different_passages_is_generated_again(monkeypatch):
+    client, calls = make_client(monkeypatch)
+
+    async def ask():
+        await client.generate_response("How much is the F900R", context=PASSAGES)
+        # A re-crawl changed the price, so the cached answer no longer applies
+        updated = [PASSAGES[0].replace("9,995", "10,495")] + PASSAGES[1:]
+        return await client.generate_response("F900R price?", context=updated)
+
+    assert asyncio.run(ask()) == "answer 2"
+    assert len(calls) == 2
+    assert client.semantic_cache.hits == 0
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from chat_manager import ChatManager
+from session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def make_store(backend, tmp_path):
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    from redis_session_store import RedisSessionStore
+
+    store = RedisSessionStore()
+    store.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return store
+
+
+def run(backend, tmp_path, scenario):
+    async def main():
+        store = make_store(backend, tmp_path)
+        try:
+            await scenario(store)
+        finally:
+            await store.close()
+
+    asyncio.run(main())
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request):
+    return request.param
+
+
+def test_history_is_trimmed_to_max_messages(backend, tmp_path):
+    async def scenario(store):
+        chat = ChatManager(store=store, max_messages=4)
+        session_id = await chat.create_session("u1")
+        for turn in range(3):
+            await chat.add_messages(session_id, [("user", f"question {turn}"), ("assistant", f"answer {turn}")])
+
+        stored = await store.load_history(session_id)
+        assert [message["content"] for message in stored] == ["question 1", "answer 1", "question 2", "answer 2"]
+        # A second worker with a cold cache sees the same trimmed history
+        other = ChatManager(store=store, max_messages=4)
+        assert [message["content"] for message in await other.get_conversation_history(session_id)] == [
+            "question 1", "answer 1", "question 2", "answer 2"
+        ]
+        assert await store.load_history("unknown") is None
+
+    run(backend, tmp_path, scenario)
+
+
+def test_expire_sessions_keeps_listed_sessions(backend, tmp_path):
+    async def scenario(store):
+        for session_id in ("s1", "s2", "s3"):
+            await store.append_messages(session_id, [{"role": "user", "content": "hi", "timestamp": "t"}], 10)
+        await store.set_user_session("u1", "s1")
+
+        expired = await store.expire_sessions(time.time() + 1, keep=["s2"])
+
+        assert sorted(expired) == ["s1", "s3"]
+        assert await store.load_history("s1") is None
+        assert await store.load_history("s2") is not None
+        assert await store.get_user_session("u1") is None
+        assert await store.counts() == {"sessions": 1, "users": 0}
+
+    run(backend, tmp_path, scenario)
+
+
+def test_expiring_old_session_keeps_users_new_link(backend, tmp_path):
+    async def scenario(store):
+        await store.set_user_session("u1", "old")
+        await store.set_user_session("u1", "new")
+
+        assert await store.expire_sessions(time.time() + 1, keep=["new"]) == ["old"]
+
+        assert await store.get_user_session("u1") == "new"
+        assert await store.counts() == {"sessions": 1, "users": 1}
+
+    run(backend, tmp_path, scenario)
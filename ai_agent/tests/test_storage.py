@@ -0,0 +1,204 @@
+"""The same storage tests against SQLite and, when DATABASE_URL points at one, PostgreSQL.
+
+The PostgreSQL run works in a throwaway database created next to the one
+DATABASE_URL names, so it needs CREATEDB but never touches existing data.
+"""
+import asyncio
+import os
+import sqlite3
+import subprocess
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+
+import pytest
+
+from sqlite_storage import MIGRATIONS, SQLiteStorage
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+POSTGRES_URL = DATABASE_URL if DATABASE_URL.startswith(("postgres://", "postgresql://")) else None
+
+BACKENDS = [
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(POSTGRES_URL is None, reason="DATABASE_URL is not a PostgreSQL URL")),
+]
+
+
+async def _with_storage(backend, tmp_path, scenario):
+    if backend == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "test.db"))
+        try:
+            await storage.initialize()
+            await scenario(storage)
+        finally:
+            await storage.close()
+        return
+
+    import asyncpg
+    from postgres_storage import PostgresStorage
+
+    name = f"bbb_test_{uuid.uuid4().hex[:12]}"
+    admin = await asyncpg.connect(POSTGRES_URL)
+    await admin.execute(f'CREATE DATABASE "{name}"')
+    storage = PostgresStorage(urlunsplit(urlsplit(POSTGRES_URL)._replace(path=f"/{name}")), max_pool_size=4)
+    try:
+        await storage.initialize()
+        await scenario(storage)
+    finally:
+        await storage.close()
+        await admin.execute(f'DROP DATABASE "{name}"')
+        await admin.close()
+
+
+def run(backend, tmp_path, scenario):
+    asyncio.run(_with_storage(backend, tmp_path, scenario))
+
+
+async def age_rows(storage, table, days):
+    """Move every row of a table `days` into the past"""
+    if isinstance(storage, SQLiteStorage):
+        db = await storage._db()
+        await db.execute(f"UPDATE {table} SET created_at = datetime(created_at, '-{days} days')")
+        await db.commit()
+    else:
+        await storage._pool.execute(f"UPDATE {table} SET created_at = created_at - make_interval(days => {days})")
+
+
+def conversation(session_id, user_id, message, response="Sure."):
+    return (session_id, user_id, message, response, None)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_write_batch_and_history(backend, tmp_path):
+    async def scenario(storage):
+        assert await storage.schema_version() == 4
+        await storage.write_batch({
+            "conversations": [
+                conversation("s1", "u1", "What does the F900R cost?"),
+                conversation("s1", "u1", "Is financing available?"),
+                conversation("s2", "u2", "Hello"),
+            ],
+            "analytics": [("chat_message", "s1", "u1", '{"channel": "rest"}')],
+        }, datetime.utcnow())
+
+        history = await storage.get_conversation_history("s1", 10)
+        assert {row["user_message"] for row in history} == {"What does the F900R cost?", "Is financing available?"}
+        assert all(row["session_id"] == "s1" for row in history)
+        assert len(await storage.get_conversation_history("s1", 1)) == 1
+
+    run(backend, tmp_path, scenario)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_search_ranks_matches_with_snippets(backend, tmp_path):
+    async def scenario(storage):
+        await storage.write_batch({
+            "conversations": [
+                conversation("s1", "u1", "Tell me about the Ducati Panigale", "The Panigale V4 makes 214 hp."),
+                conversation("s2", "u2", "Do you deliver?", "Free delivery within 50 miles."),
+            ],
+        }, datetime.utcnow())
+
+        results = await storage.search_conversations("panigale", 10)
+        assert [row["session_id"] for row in results] == ["s1"]
+        assert "Panigale" in results[0]["snippet"]
+        assert await storage.search_conversations("helicopter", 10) == []
+        assert await storage.search_conversations("", 10) == []
+
+    run(backend, tmp_path, scenario)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_rollups_accumulate_across_batches(backend, tmp_path):
+    async def scenario(storage):
+        now = datetime.utcnow()
+        # Two batches, so the second has to merge into the sketches the first stored
+        await storage.write_batch({
+            "conversations": [conversation(f"s{i}", f"u{i % 5}", "F900R price?") for i in range(10)],
+            "analytics": [("chat_message", None, None, None)] * 3,
+        }, now)
+        await storage.write_batch({
+            "conversations": [conversation("s99", "u99", "financing options")] + [conversation("s0", "u0", "F900R price!")],
+            "analytics": [("chat_message", None, None, None), ("page_view", None, None, None)],
+        }, now)
+
+        summary = await storage.get_analytics_summary(7)
+        assert summary["total_conversations"] == 12
+        assert summary["unique_users"] == 6
+        assert summary["event_counts"] == {"chat_message": 4, "page_view": 1}
+
+        popular = await storage.get_popular_queries(2)
+        assert popular[0]["query"] == "f900r price"
+        assert popular[0]["count"] == 11
+        assert popular[1]["query"] == "financing options"
+
+    run(backend, tmp_path, scenario)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_delete_expired_in_batches(backend, tmp_path):
+    async def scenario(storage):
+        await storage.write_batch({
+            "conversations": [conversation(f"s{i}", "u1", f"old question {i}") for i in range(5)],
+        }, datetime.utcnow())
+        await age_rows(storage, "conversations", 40)
+        await storage.write_batch({"conversations": [conversation("new", "u1", "new question")]}, datetime.utcnow())
+
+        assert await storage.delete_expired("conversations", 30, 2) == 2
+        assert await storage.delete_expired("conversations", 30, 10) == 3
+        assert await storage.delete_expired("conversations", 30, 10) == 0
+        assert len(await storage.get_conversation_history("new", 10)) == 1
+        # Rollups keep covering the deleted period
+        assert (await storage.get_analytics_summary(7))["total_conversations"] == 6
+
+    run(backend, tmp_path, scenario)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backup(backend, tmp_path):
+    backup_path = tmp_path / "backup"
+
+    async def scenario(storage):
+        await storage.write_batch({
+            "conversations": [conversation("s1", "u1", "back me up"), conversation("s2", "u2", "and me")],
+        }, datetime.utcnow())
+        await storage.backup(str(backup_path))
+
+    run(backend, tmp_path, scenario)
+
+    assert backed_up_messages(backend, backup_path) == ["and me", "back me up"]
+
+
+def backed_up_messages(backend, backup_path):
+    """User messages in a backup, read back with the backend's own tooling"""
+    if backend == "sqlite":
+        with sqlite3.connect(backup_path) as backup:
+            rows = backup.execute("SELECT user_message FROM conversations").fetchall()
+        return sorted(message for message, in rows)
+
+    # pg_restore prints the custom-format archive's table data as COPY blocks
+    restored = subprocess.run(
+        ["pg_restore", "--data-only", "--table=conversations", "--file=-", str(backup_path)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    copy_block = restored.split("COPY public.conversations", 1)[1].split("\\.", 1)[0]
+    columns = copy_block.split("(", 1)[1].split(")", 1)[0].split(", ")
+    rows = [line.split("\t") for line in copy_block.split("\n")[1:] if line]
+    return sorted(row[columns.index("user_message")] for row in rows)
+
+
+def test_concurrent_sqlite_migrations_apply_once(tmp_path):
+    """Two workers starting on one database file must not both apply a migration"""
+    async def scenario():
+        storages = [SQLiteStorage(str(tmp_path / "shared.db")) for _ in range(2)]
+        try:
+            await asyncio.gather(*(storage.initialize() for storage in storages))
+            db = await storages[0]._db()
+            async with db.execute("SELECT version FROM schema_migrations ORDER BY version") as cursor:
+                versions = [row["version"] for row in await cursor.fetchall()]
+            assert versions == [version for version, _, _ in MIGRATIONS]
+        finally:
+            for storage in storages:
+                await storage.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,182 @@
+import functools
+import http.server
+import os
+import shutil
+import threading
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+import website_scraper
+from website_scraper import WebsiteScraper
+
+FIXTURE_SITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "site")
+CHROME = next(
+    (shutil.which(name) for name in ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser") if shutil.which(name)),
+    None
+)
+
+READY = {"rendered": True, "network_idle": True, "dom_quiet": True, "loading": False}
+
+
+def make_scraper(tmp_path, **options) -> WebsiteScraper:
+    return WebsiteScraper(
+        base_url="http://127.0.0.1",
+        data_file=str(tmp_path / "scraped.json"),
+        state_file=str(tmp_path / "state.json"),
+        journal_file=str(tmp_path / "journal.jsonl"),
+        products_from_api=False,
+        **options
+    )
+
+
+@pytest.fixture
+def fixture_site():
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=FIXTURE_SITE)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.skipif(CHROME is None, reason="Chrome is not installed")
+def test_scrape_fixture_site_with_two_workers(tmp_path, fixture_site):
+    scraper = make_scraper(tmp_path, max_workers=2, page_timeout=10.0, quiet_ms=200)
+    urls = [f"{fixture_site}/{page}" for page in ("index.html", "about.html", "contact.html")]
+
+    journal = scraper.scrape_urls(urls)
+
+    assert [entry["url"] for entry in scraper.scraped_data] == urls
+    assert len(journal.added) == 3
+    about = scraper.scraped_data[1]
+    assert about["title"] == "About Big Bike Blitz"
+    assert "free delivery" in about["content"]
+    assert "Loading" not in about["content"]
+    assert scraper.last_crawl["failed"] == 0
+    assert scraper.search("delivery")[0]["url"] == urls[1]
+
+
+class FakeDriver:
+    """Renders every URL instantly, except that it crashes on the URLs it is told to"""
+
+    def __init__(self, crash_on):
+        self.crash_on = crash_on
+        self.url = None
+        self.quit_called = False
+
+    def get(self, url):
+        if self.crash_on(url):
+            raise WebDriverException(f"chrome not reachable while loading {url}")
+        self.url = url
+
+    def execute_script(self, script, *args):
+        return READY
+
+    @property
+    def page_source(self):
+        return f"<html><head><title>{self.url}</title></head><body><div id='root'>Page {self.url}</div></body></html>"
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def fake_browser(monkeypatch):
+    """Patch out Chrome; returns the list of drivers created so far"""
+    drivers = []
+    crashes = {"count": {}, "plan": {}}  # url -> crashes so far / crashes to cause
+
+    def crash_on(url):
+        done = crashes["count"].get(url, 0)
+        if done < crashes["plan"].get(url, 0):
+            crashes["count"][url] = done + 1
+            return True
+        return False
+
+    def create_driver(self, driver_path):
+        driver = FakeDriver(crash_on)
+        drivers.append(driver)
+        return driver
+
+    monkeypatch.setattr(website_scraper, "ChromeDriverManager", lambda: type("Manager", (), {"install": lambda self: "chromedriver"})())
+    monkeypatch.setattr(WebsiteScraper, "_create_driver", create_driver)
+    monkeypatch.setattr(WebsiteScraper, "check_validators", lambda self, url: (False, {}))
+    return drivers, crashes["plan"]
+
+
+def test_crashed_browser_is_replaced_and_url_requeued(tmp_path, fake_browser):
+    drivers, crash_plan = fake_browser
+    urls = [f"http://127.0.0.1/page{i}" for i in range(8)]
+    crash_plan[urls[2]] = 1  # crashes once, then renders on the retry
+    crash_plan[urls[5]] = 1
+    scraper = make_scraper(tmp_path, max_workers=2, max_attempts=2)
+
+    journal = scraper.scrape_urls(urls)
+
+    assert [entry["url"] for entry in scraper.scraped_data] == urls
+    assert len(journal.added) == 8
+    assert scraper.last_crawl["browser_restarts"] == 2
+    assert scraper.last_crawl["failed"] == 0
+    # One browser per worker that got work, plus one replacement per crash; all shut down at the end
+    assert 3 <= len(drivers) <= 4
+    assert all(driver.quit_called for driver in drivers)
+
+
+def test_url_that_keeps_crashing_fails_after_max_attempts(tmp_path, fake_browser):
+    drivers, crash_plan = fake_browser
+    urls = [f"http://127.0.0.1/page{i}" for i in range(4)]
+    crash_plan[urls[1]] = 10
+    scraper = make_scraper(tmp_path, max_workers=2, max_attempts=3)
+
+    scraper.scrape_urls(urls)
+
+    assert [entry["url"] for entry in scraper.scraped_data] == [urls[0], urls[2], urls[3]]
+    assert scraper.last_crawl["browser_restarts"] == 3
+    assert scraper.last_crawl["failed"] == 1
+    assert all(driver.quit_called for driver in drivers)
+
+
+def test_served_scraper_applies_crawler_journal(tmp_path, fake_browser):
+    urls = [f"http://127.0.0.1/page{i}" for i in range(4)]
+    served = make_scraper(tmp_path)
+    crawler = make_scraper(tmp_path, build_index=False)
+    journal = crawler.scrape_urls(urls)
+    assert len(crawler.index) == 0
+
+    assert served.apply_crawl(journal)
+    assert [entry["url"] for entry in served.scraped_data] == urls
+    assert served.search("page2")[0]["url"] == urls[2]
+
+    # Learned render times outlive the crawler that measured them
+    assert make_scraper(tmp_path).route_timeouts.samples() == crawler.route_timeouts.samples() != {}
+
+    crawler.get_all_urls = lambda: urls[:2]
+    assert served.apply_crawl(crawler.scrape_urls())
+    assert [entry["url"] for entry in served.scraped_data] == urls[:2]
+    assert {result["url"] for result in served.search("page3")} <= set(urls[:2])
+
+    # A journal that skips one the served data never saw is refused, leaving the data as it was
+    for site in (urls[:1], urls[1:2]):
+        crawler.get_all_urls = lambda site=site: site
+        journal = crawler.scrape_urls()
+    assert not served.apply_crawl(journal)
+    assert len(served.scraped_data) == 2
+
+
+def test_products_gone_from_listing_are_removed(tmp_path, fake_browser):
+    home, first, second = "http://127.0.0.1/", "http://127.0.0.1/product/1", "http://127.0.0.1/product/2"
+    scraper = make_scraper(tmp_path)
+    for listing in ([home, first, second], [home, first]):
+        scraper.get_all_urls = lambda listing=listing: listing
+        journal = scraper.scrape_urls()
+
+    assert journal.removed == [second]
+    assert [entry["url"] for entry in scraper.scraped_data] == [home, first]
+
+    # No product routes at all means the bike listing failed, so the last known products stay
+    scraper.get_all_urls = lambda: [home]
+    journal = scraper.scrape_urls()
+    assert journal.removed == []
+    assert [entry["url"] for entry in scraper.scraped_data] == [home, first]
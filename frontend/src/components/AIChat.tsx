@@ -29,6 +29,7 @@ const AIChat: React.FC<AIChatProps> = ({ isOpen, onClose }) => {
   const [connectionStatus, setConnectionStatus] = useState<'connecting' | 'connected' | 'error'>('connecting');
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const wsRef = useRef<WebSocket | null>(null);
+  const streamingMessageIdRef = useRef<string | null>(null);
   const [isMobile, setIsMobile] = useState(window.innerWidth < 900);
 
   const scrollToBottom = () => {
@@ -67,9 +68,20 @@ const AIChat: React.FC<AIChatProps> = ({ isOpen, onClose }) => {
         const data = JSON.parse(event.data);
         console.log('Received AI message:', data);
         
-        if (data.type === 'response') {
+        if (data.type === 'token') {
           setIsLoading(false);
-          addMessage('bot', data.message, data.sources);
+          appendToStreamingMessage(data.content);
+        } else if (data.type === 'response') {
+          setIsLoading(false);
+          if (streamingMessageIdRef.current) {
+            const streamingId = streamingMessageIdRef.current;
+            streamingMessageIdRef.current = null;
+            setMessages(prev => prev.map(msg =>
+              msg.id === streamingId ? { ...msg, text: data.message, sources: data.sources } : msg
+            ));
+          } else {
+            addMessage('bot', data.message, data.sources);
+          }
         } else if (data.type === 'system') {
           setIsLoading(false);
           addMessage('bot', data.message);
@@ -111,6 +123,19 @@ const AIChat: React.FC<AIChatProps> = ({ isOpen, onClose }) => {
     setMessages(prev => [...prev, newMessage]);
   };
 
+  const appendToStreamingMessage = (chunk: string) => {
+    if (!streamingMessageIdRef.current) {
+      const streamingId = `stream_${Date.now()}`;
+      streamingMessageIdRef.current = streamingId;
+      setMessages(prev => [...prev, { id: streamingId, text: chunk, sender: 'bot', timestamp: new Date() }]);
+      return;
+    }
+    const streamingId = streamingMessageIdRef.current;
+    setMessages(prev => prev.map(msg =>
+      msg.id === streamingId ? { ...msg, text: msg.text + chunk } : msg
+    ));
+  };
+
   const handleSend = async () => {
     if (!inputValue.trim() || isLoading) return;
 